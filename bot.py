@@ -1,16 +1,39 @@
 import asyncio
 import logging
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command, CommandStart
-from aiogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, InputFile
+from aiogram.filters import Command, CommandObject, CommandStart, StateFilter
+from aiogram.types import (
+    Message, InlineKeyboardMarkup, InlineKeyboardButton, InputFile, InlineQuery, InlineQueryResultArticle,
+    InputTextMessageContent
+)
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.exceptions import (
+    TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter,
+    TelegramServerError
+)
 import aiohttp
 import json
+import sqlite3
+import hashlib
+import base64
 import os
 from datetime import datetime, timedelta
 from bs4 import BeautifulSoup
+try:
+    from lxml import html as lxml_html
+except ImportError:
+    lxml_html = None
 import re
+import bisect
+from html import escape as html_escape
+import threading
+import uuid
+import time
+import multiprocessing
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from collections import OrderedDict
+from itertools import islice
 from typing import List, Dict, Any, Optional
 
 
@@ -62,111 +85,786 @@ class AdminStates(StatesGroup):
     waiting_for_new_admin = State()  
 
 
+class SearchStates(StatesGroup):
+    waiting_for_group_query = State()
+    waiting_for_teacher_query = State()
+
+
 USERS_FILE = 'users.json'
 CACHE_FILE = 'schedule_cache.json'
 ADMINS_FILE = 'admins.json'
 GROUPS_FILE = 'groups_cache.json'
 TEACHERS_FILE = 'teachers_cache.json'
 FAVORITES_FILE = 'favorites.json'
+VALIDATORS_FILE = 'http_validators.json'
+BROADCASTS_FILE = 'broadcasts.json'
+ENTITY_IDS_FILE = 'entity_ids.json'
 
 
-def load_users():
-    if os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'r', encoding='utf-8') as f:
+STORAGE_BACKEND = 'sqlite'
+DATABASE_FILE = 'bot.db'
+STATE_FLUSH_INTERVAL = 5
+
+
+_state: Dict[str, Any] = {}
+_dirty: Dict[str, Optional[set]] = {}
+_write_lock = threading.Lock()
+_storage = None
+
+
+class JsonStorage:
+    """Хранение данных в JSON-файлах: каждый файл переписывается целиком"""
+    
+    def exists(self, name: str) -> bool:
+        return os.path.exists(name)
+    
+    def load(self, name: str) -> Any:
+        if not os.path.exists(name):
+            return None
+        with open(name, 'r', encoding='utf-8') as f:
             return json.load(f)
-    return []
+    
+    def snapshot(self, name: str, data: Any, keys: Optional[set]) -> str:
+        return json.dumps(data, ensure_ascii=False, indent=2)
+    
+    def write(self, batch: List[tuple]):
+        with _write_lock:
+            for name, payload in batch:
+                tmp_path = f"{name}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(payload)
+                os.replace(tmp_path, name)
+
+
+class SqliteStorage:
+    """Хранение данных в SQLite (WAL): индексированные таблицы и построчные upsert"""
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            first_seen REAL,
+            last_seen REAL,
+            inactive_since REAL,
+            inactive_reason TEXT
+        );
+        CREATE TABLE IF NOT EXISTS admins (
+            user_id TEXT PRIMARY KEY
+        );
+        CREATE TABLE IF NOT EXISTS favorites (
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            PRIMARY KEY (user_id, kind, name)
+        );
+        CREATE INDEX IF NOT EXISTS favorites_by_entity ON favorites (kind, name);
+        CREATE TABLE IF NOT EXISTS schedules (
+            section TEXT NOT NULL,
+            cache_key TEXT NOT NULL,
+            entry TEXT NOT NULL,
+            fetched_at REAL,
+            PRIMARY KEY (section, cache_key)
+        );
+        CREATE TABLE IF NOT EXISTS http_validators (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT
+        );
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            job_id TEXT PRIMARY KEY,
+            record TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            user_id TEXT NOT NULL,
+            PRIMARY KEY (job_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS kv (
+            name TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+    """
+    KV_NAMES = {GROUPS_FILE, TEACHERS_FILE}
+    
+    def __init__(self, path: str):
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+        self._ensure_columns('users', {'first_seen': 'REAL', 'last_seen': 'REAL',
+                                       'inactive_since': 'REAL', 'inactive_reason': 'TEXT'})
+    
+    def _ensure_columns(self, table: str, columns: Dict[str, str]):
+        """Добавляет в таблицу колонки, появившиеся в новых версиях схемы"""
+        existing = {row[1] for row in self.connection.execute(f"PRAGMA table_info({table})")}
+        for column, column_type in columns.items():
+            if column not in existing:
+                self.connection.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    
+    def _get_kv(self, name: str) -> Any:
+        row = self.connection.execute("SELECT value FROM kv WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+    
+    @staticmethod
+    def _kv_op(name: str, value: Any) -> tuple:
+        return ("INSERT OR REPLACE INTO kv (name, value) VALUES (?, ?)",
+                [(name, json.dumps(value, ensure_ascii=False))])
+    
+    def exists(self, name: str) -> bool:
+        if name == ADMINS_FILE:
+            return self.connection.execute("SELECT 1 FROM admins LIMIT 1").fetchone() is not None
+        return True
+    
+    def load(self, name: str) -> Any:
+        with _write_lock:
+            if name == USERS_FILE:
+                return {
+                    user_id: {"first_seen": first_seen, "last_seen": last_seen,
+                              "inactive_since": inactive_since, "inactive_reason": inactive_reason}
+                    for user_id, first_seen, last_seen, inactive_since, inactive_reason in self.connection.execute(
+                        "SELECT user_id, first_seen, last_seen, inactive_since, inactive_reason "
+                        "FROM users ORDER BY rowid")
+                }
+            if name == ADMINS_FILE:
+                return [row[0] for row in self.connection.execute("SELECT user_id FROM admins ORDER BY rowid")]
+            if name == FAVORITES_FILE:
+                favorites = {}
+                for user_id, kind, entity in self.connection.execute(
+                        "SELECT user_id, kind, name FROM favorites ORDER BY rowid"):
+                    favorites.setdefault(user_id, {"groups": [], "teachers": []}).setdefault(kind, []).append(entity)
+                return favorites
+            if name == CACHE_FILE:
+                cache = {"last_update": self._get_kv(f"{CACHE_FILE}:last_update"), "teachers": {}, "groups": {}}
+                for section, cache_key, entry in self.connection.execute(
+                        "SELECT section, cache_key, entry FROM schedules"):
+                    cache.setdefault(section, {})[cache_key] = json.loads(entry)
+                return cache
+            if name == VALIDATORS_FILE:
+                return {
+                    url: {"etag": etag, "last_modified": last_modified, "content_hash": content_hash}
+                    for url, etag, last_modified, content_hash in self.connection.execute(
+                        "SELECT url, etag, last_modified, content_hash FROM http_validators")
+                }
+            if name == BROADCASTS_FILE:
+                jobs = {
+                    job_id: dict(json.loads(record), recipients=[])
+                    for job_id, record in self.connection.execute("SELECT job_id, record FROM broadcast_jobs")
+                }
+                for job_id, user_id in self.connection.execute(
+                        "SELECT job_id, user_id FROM broadcast_recipients ORDER BY job_id, position"):
+                    if job_id in jobs:
+                        jobs[job_id]["recipients"].append(user_id)
+                return jobs
+            return self._get_kv(name)
+    
+    def snapshot(self, name: str, data: Any, keys: Optional[set]) -> List[tuple]:
+        """Готовит SQL-операции для изменённых строк (keys=None — для всей таблицы)"""
+        if name == USERS_FILE:
+            user_ids = data.keys() if keys is None else keys
+            ops = [("DELETE FROM users", [()])] if keys is None else []
+            return ops + [
+                ("INSERT INTO users (user_id, first_seen, last_seen, inactive_since, inactive_reason) "
+                 "VALUES (?, ?, ?, ?, ?) "
+                 "ON CONFLICT (user_id) DO UPDATE SET last_seen = excluded.last_seen, "
+                 "inactive_since = excluded.inactive_since, inactive_reason = excluded.inactive_reason",
+                 [(user_id, data[user_id].get("first_seen"), data[user_id].get("last_seen"),
+                   data[user_id].get("inactive_since"), data[user_id].get("inactive_reason"))
+                  for user_id in user_ids if user_id in data]),
+                ("DELETE FROM users WHERE user_id = ?", [(user_id,) for user_id in user_ids if user_id not in data]),
+            ]
+        
+        if name == ADMINS_FILE:
+            return [("DELETE FROM admins", [()]),
+                    ("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", [(user_id,) for user_id in data])]
+        
+        if name == FAVORITES_FILE:
+            user_ids = data.keys() if keys is None else keys
+            rows = [
+                (user_id, kind, entity)
+                for user_id in user_ids
+                for kind, entities in data.get(user_id, {}).items()
+                for entity in entities
+            ]
+            delete = ("DELETE FROM favorites", [()]) if keys is None else \
+                ("DELETE FROM favorites WHERE user_id = ?", [(user_id,) for user_id in keys])
+            return [delete, ("INSERT OR IGNORE INTO favorites (user_id, kind, name) VALUES (?, ?, ?)", rows)]
+        
+        if name == CACHE_FILE:
+            if keys is None:
+                keys = {(section, cache_key) for section in ('groups', 'teachers') for cache_key in data.get(section, {})}
+                ops = [("DELETE FROM schedules", [()])]
+            else:
+                ops = []
+            upserts = []
+            deletes = []
+            for section, cache_key in keys:
+                entry = data.get(section, {}).get(cache_key)
+                if entry is None:
+                    deletes.append((section, cache_key))
+                else:
+                    upserts.append((section, cache_key, json.dumps(entry, ensure_ascii=False),
+                                    entry.get("fetched_at") if isinstance(entry, dict) else None))
+            return ops + [
+                ("DELETE FROM schedules WHERE section = ? AND cache_key = ?", deletes),
+                ("INSERT OR REPLACE INTO schedules (section, cache_key, entry, fetched_at) VALUES (?, ?, ?, ?)", upserts),
+                self._kv_op(f"{CACHE_FILE}:last_update", data.get("last_update")),
+            ]
+        
+        if name == VALIDATORS_FILE:
+            urls = data.keys() if keys is None else keys
+            ops = [("DELETE FROM http_validators", [()])] if keys is None else []
+            return ops + [(
+                "INSERT OR REPLACE INTO http_validators (url, etag, last_modified, content_hash) VALUES (?, ?, ?, ?)",
+                [(url, data[url].get("etag"), data[url].get("last_modified"), data[url].get("content_hash"))
+                 for url in urls if url in data]
+            )]
+        
+        if name == BROADCASTS_FILE:
+            if keys is None:
+                keys = set(data) | {('recipients', job_id) for job_id in data}
+                ops = [("DELETE FROM broadcast_jobs", [()]), ("DELETE FROM broadcast_recipients", [()])]
+            else:
+                ops = []
+            records = []
+            deleted = []
+            recipients = []
+            for key in keys:
+                if isinstance(key, tuple):
+                    job_id = key[1]
+                    if job_id in data:
+                        deleted.append((job_id,))
+                        recipients.extend(
+                            (job_id, position, user_id) for position, user_id in enumerate(data[job_id]["recipients"])
+                        )
+                elif key in data:
+                    record = {field: value for field, value in data[key].items() if field != "recipients"}
+                    records.append((key, json.dumps(record, ensure_ascii=False)))
+                else:
+                    deleted.append((key,))
+            return ops + [
+                ("DELETE FROM broadcast_recipients WHERE job_id = ?", deleted),
+                ("DELETE FROM broadcast_jobs WHERE job_id = ?", [job for job in deleted if job[0] not in data]),
+                ("INSERT OR REPLACE INTO broadcast_jobs (job_id, record) VALUES (?, ?)", records),
+                ("INSERT INTO broadcast_recipients (job_id, position, user_id) VALUES (?, ?, ?)", recipients),
+            ]
+        
+        return [self._kv_op(name, data)]
+    
+    def write(self, batch: List[tuple]):
+        with _write_lock, self.connection:
+            for name, ops in batch:
+                for sql, rows in ops:
+                    if rows:
+                        self.connection.executemany(sql, rows)
+    
+    def migrate_from_json(self):
+        """Однократно переносит данные из JSON-файлов в базу"""
+        if self._get_kv('migrated_from_json'):
+            return
+        
+        json_storage = JsonStorage()
+        batch = []
+        for name in (USERS_FILE, ADMINS_FILE, FAVORITES_FILE, CACHE_FILE, GROUPS_FILE, TEACHERS_FILE, VALIDATORS_FILE,
+                     BROADCASTS_FILE, ENTITY_IDS_FILE):
+            data = json_storage.load(name)
+            if data is not None:
+                if name == USERS_FILE:
+                    data = _users_to_dict(data)
+                batch.append((name, self.snapshot(name, data, None)))
+                logger.info(f"Перенос {name} в {DATABASE_FILE}")
+        batch.append(('kv', [self._kv_op('migrated_from_json', datetime.now().isoformat())]))
+        self.write(batch)
+
+
+def get_storage():
+    """Возвращает выбранное хранилище данных (STORAGE_BACKEND)"""
+    global _storage
+    
+    if _storage is None:
+        if STORAGE_BACKEND == 'sqlite':
+            _storage = SqliteStorage(DATABASE_FILE)
+            _storage.migrate_from_json()
+        else:
+            _storage = JsonStorage()
+    return _storage
+
+
+def _load_state(path: str, default_factory, prepare=None):
+    """Возвращает данные из памяти, при первом обращении читает их из хранилища"""
+    if path not in _state:
+        data = get_storage().load(path)
+        if data is None:
+            data = default_factory()
+        elif prepare:
+            data = prepare(data)
+        _state[path] = data
+    return _state[path]
+
+def _save_state(path: str, data, changed=None):
+    """Обновляет данные в памяти и помечает их для записи (changed — ключи изменённых строк)"""
+    _state[path] = data
+    if changed is None:
+        _dirty[path] = None
+    elif path not in _dirty:
+        _dirty[path] = set(changed)
+    elif _dirty[path] is not None:
+        _dirty[path].update(changed)
+
+async def flush_state():
+    """Сбрасывает все изменения в хранилище одним пакетом"""
+    if not _dirty:
+        return
+    
+    dirty = dict(_dirty)
+    _dirty.clear()
+    storage = get_storage()
+    batch = [(path, storage.snapshot(path, _state[path], keys)) for path, keys in dirty.items()]
+    
+    try:
+        await asyncio.to_thread(storage.write, batch)
+    except Exception as e:
+        logger.error(f"Ошибка при сохранении данных: {e}")
+        for path, keys in dirty.items():
+            _save_state(path, _state[path], keys)
+
+async def state_flush_loop():
+    """Периодически сбрасывает изменения в хранилище"""
+    while True:
+        await asyncio.sleep(STATE_FLUSH_INTERVAL)
+        await flush_state()
+
+def init_state():
+    """Загружает все данные в память при запуске бота, создавая недостающие"""
+    storage = get_storage()
+    for path, load in [
+        (USERS_FILE, load_users),
+        (CACHE_FILE, load_cache),
+        (ADMINS_FILE, load_admins),
+        (GROUPS_FILE, load_groups_cache),
+        (TEACHERS_FILE, load_teachers_cache),
+        (FAVORITES_FILE, load_favorites),
+        (VALIDATORS_FILE, load_validators),
+        (BROADCASTS_FILE, load_broadcasts),
+        (ENTITY_IDS_FILE, load_entity_ids)
+    ]:
+        data = load()
+        if not storage.exists(path):
+            _save_state(path, data)
+    logger.info(f"Данные загружены в память ({STORAGE_BACKEND})")
 
-def save_users(users):
-    with open(USERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(users, f, ensure_ascii=False, indent=2)
+
+USER_SEEN_RESOLUTION = 60
+
+
+def _users_to_dict(data):
+    """Приводит старый список ID пользователей к словарю с отметками времени"""
+    if isinstance(data, list):
+        return {user_id: {"first_seen": None, "last_seen": None} for user_id in data}
+    return data
+
+def load_users():
+    return _load_state(USERS_FILE, dict, prepare=_users_to_dict)
+
+def save_users(users, changed=None):
+    _save_state(USERS_FILE, users, changed)
+
+def register_user(user_id: str) -> bool:
+    """Регистрирует пользователя за O(1); возвращает True, если он новый"""
+    users = load_users()
+    now = time.time()
+    
+    if user_id in users:
+        touch_user(user_id, now)
+        return False
+    
+    users[user_id] = {"first_seen": now, "last_seen": now}
+    save_users(users, changed=[user_id])
+    return True
+
+def touch_user(user_id: str, now: Optional[float] = None):
+    """Обновляет время последней активности пользователя (не чаще USER_SEEN_RESOLUTION)"""
+    users = load_users()
+    user = users.get(user_id)
+    if user is None:
+        return
+    
+    now = now or time.time()
+    if user.get("inactive_since"):
+        logger.info(f"Пользователь {user_id} снова активен")
+        user["inactive_since"] = None
+        user["inactive_reason"] = None
+        user["last_seen"] = now
+        save_users(users, changed=[user_id])
+    elif now - (user.get("last_seen") or 0) >= USER_SEEN_RESOLUTION:
+        user["last_seen"] = now
+        save_users(users, changed=[user_id])
+
+INACTIVE_REASONS = {
+    'blocked': 'заблокировали бота',
+    'not_found': 'чат не найден',
+    'deactivated': 'аккаунт удалён',
+}
+CHURN_WINDOW_DAYS = 7
+
+def mark_user_inactive(user_id: str, reason: str):
+    """Помечает пользователя неактивным: рассылки его пропускают до следующего обращения к боту"""
+    users = load_users()
+    user = users.get(user_id)
+    if user is None or user.get("inactive_since"):
+        return
+    
+    user["inactive_since"] = time.time()
+    user["inactive_reason"] = reason
+    save_users(users, changed=[user_id])
+    logger.info(f"Пользователь {user_id} помечен неактивным: {INACTIVE_REASONS.get(reason, reason)}")
+
+def get_active_users() -> List[str]:
+    return [user_id for user_id, user in load_users().items() if not user.get("inactive_since")]
+
+def get_user_churn_stats(days: int = CHURN_WINDOW_DAYS) -> Dict[str, Any]:
+    """Считает активных, неактивных по причинам, новых и ушедших за последние days дней"""
+    since = time.time() - days * 24 * 3600
+    stats = {"active": 0, "inactive": 0, "reasons": {}, "joined": 0, "left": 0}
+    
+    for user in load_users().values():
+        if (user.get("first_seen") or 0) >= since:
+            stats["joined"] += 1
+        if user.get("inactive_since"):
+            stats["inactive"] += 1
+            stats["reasons"][user["inactive_reason"]] = stats["reasons"].get(user["inactive_reason"], 0) + 1
+            if user["inactive_since"] >= since:
+                stats["left"] += 1
+        else:
+            stats["active"] += 1
+    return stats
 
 def load_cache():
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {"last_update": None, "teachers": {}, "groups": {}}
+    return _load_state(CACHE_FILE, lambda: {"last_update": None, "teachers": {}, "groups": {}})
 
-def save_cache(cache):
-    with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-        json.dump(cache, f, ensure_ascii=False, indent=2)
+def save_cache(cache, changed=None):
+    _save_state(CACHE_FILE, cache, changed)
 
 def load_admins():
-    if os.path.exists(ADMINS_FILE):
-        with open(ADMINS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+    if ADMINS_FILE in _state or get_storage().exists(ADMINS_FILE):
+        return _load_state(ADMINS_FILE, list)
 
     admins = [MAIN_ADMIN_ID]
     save_admins(admins)
     return admins
 
 def save_admins(admins):
-    with open(ADMINS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(admins, f, ensure_ascii=False, indent=2)
+    _save_state(ADMINS_FILE, admins)
 
 def load_groups_cache():
-    if os.path.exists(GROUPS_FILE):
-        with open(GROUPS_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {"last_update": None, "groups": []}
+    return _load_state(GROUPS_FILE, lambda: {"last_update": None, "groups": []})
 
 def save_groups_cache(groups_data):
-    with open(GROUPS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(groups_data, f, ensure_ascii=False, indent=2)
+    _save_state(GROUPS_FILE, groups_data)
+    rebuild_list_indexes('groups')
+
+def _filter_vacancies(data):
+    if "teachers" in data:
+        filtered_teachers = [
+            teacher for teacher in data["teachers"] 
+            if teacher.get('name', '') not in ['Ваканс', 'Вакансия', 'ваканс', 'вакансия', 'ВАКАНСИЯ']
+        ]
+        data["teachers"] = filtered_teachers
+    return data
 
 def load_teachers_cache():
-    if os.path.exists(TEACHERS_FILE):
-        with open(TEACHERS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-
-            if "teachers" in data:
-                filtered_teachers = [
-                    teacher for teacher in data["teachers"] 
-                    if teacher.get('name', '') not in ['Ваканс', 'Вакансия', 'ваканс', 'вакансия', 'ВАКАНСИЯ']
-                ]
-                data["teachers"] = filtered_teachers
-            return data
-    return {"last_update": None, "teachers": []}
+    return _load_state(TEACHERS_FILE, lambda: {"last_update": None, "teachers": []}, prepare=_filter_vacancies)
 
 def save_teachers_cache(teachers_data):
-    with open(TEACHERS_FILE, 'w', encoding='utf-8') as f:
-        json.dump(teachers_data, f, ensure_ascii=False, indent=2)
+    _save_state(TEACHERS_FILE, _filter_vacancies(teachers_data))
+    rebuild_list_indexes('teachers')
 
 def load_favorites():
-    if os.path.exists(FAVORITES_FILE):
-        with open(FAVORITES_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+    return _load_state(FAVORITES_FILE, dict)
+
+def save_favorites(favorites, changed=None):
+    _save_state(FAVORITES_FILE, favorites, changed)
+
+def load_validators():
+    return _load_state(VALIDATORS_FILE, dict)
+
+def save_validators(validators, changed=None):
+    _save_state(VALIDATORS_FILE, validators, changed)
+
+def load_broadcasts():
+    return _load_state(BROADCASTS_FILE, dict)
+
+def save_broadcasts(broadcasts, changed=None):
+    _save_state(BROADCASTS_FILE, broadcasts, changed)
+
+def load_entity_ids():
+    return _load_state(ENTITY_IDS_FILE, lambda: {"groups": {}, "teachers": {}})
+
+def save_entity_ids(entity_ids):
+    _save_state(ENTITY_IDS_FILE, entity_ids)
+
+
+ENTITY_CALLBACK_PREFIX = "~"
+ENTITY_ACTIONS = {
+    'group': ('g', 'groups'),
+    'add_favorite_group': ('a', 'groups'),
+    'remove_favorite_group': ('r', 'groups'),
+    'refresh_group': ('u', 'groups'),
+    'teacher': ('t', 'teachers'),
+    'add_favorite_teacher': ('A', 'teachers'),
+    'remove_favorite_teacher': ('R', 'teachers'),
+    'refresh_teacher': ('U', 'teachers'),
+    'group_view': ('v', 'groups'),
+    'teacher_view': ('V', 'teachers'),
+}
+_ACTIONS_BY_CODE = {code: kind for code, kind in ENTITY_ACTIONS.values()}
+STALE_BUTTON_TEXT = "Кнопка устарела, откройте список заново"
+
+
+class ListIndex:
+    """Словари по списку групп или преподавателей: название → запись, название → позиция"""
+    
+    def __init__(self, entities: List[Dict]):
+        self.by_name = {}
+        self.positions = {}
+        for position, entity in enumerate(entities):
+            name = entity.get('name', '')
+            self.by_name[name] = entity
+            self.positions.setdefault(name, position)
+    
+    def select(self, names) -> List[Dict]:
+        """Возвращает записи для набора названий в порядке исходного списка"""
+        return sorted((self.by_name[name] for name in names if name in self.by_name),
+                      key=lambda entity: self.positions[entity.get('name', '')])
+
+
+_entity_names: Dict[str, Dict[int, str]] = {}
+_list_indexes: Dict[str, ListIndex] = {}
+
+
+def _list_entities(kind: str) -> List[Dict]:
+    if kind == 'groups':
+        return load_groups_cache().get('groups', [])
+    return load_teachers_cache().get('teachers', [])
+
+
+def rebuild_entity_registry(kind: str):
+    """Выдаёт постоянные ID новым названиям и перестраивает таблицу ID → название"""
+    entity_ids = load_entity_ids()
+    ids = entity_ids.setdefault(kind, {})
+    next_id = max(ids.values(), default=0) + 1
+    added = False
+    
+    for entity in _list_entities(kind):
+        name = entity.get('name', '')
+        if name not in ids:
+            ids[name] = next_id
+            next_id += 1
+            added = True
+    
+    if added:
+        save_entity_ids(entity_ids)
+    _entity_names[kind] = {entity_id: name for name, entity_id in ids.items()}
+
+
+def rebuild_list_indexes(kind: str):
+    """Перестраивает все индексы по списку групп или преподавателей после его обновления"""
+    _list_indexes[kind] = ListIndex(_list_entities(kind))
+    rebuild_entity_registry(kind)
+    rebuild_search_index(kind)
+
+
+def get_list_index(kind: str) -> ListIndex:
+    index = _list_indexes.get(kind)
+    if index is None:
+        index = _list_indexes[kind] = ListIndex(_list_entities(kind))
+    return index
+
+
+def get_entity_id(kind: str, name: str) -> int:
+    """Возвращает постоянный ID группы или преподавателя, выдавая новый при необходимости"""
+    entity_ids = load_entity_ids()
+    ids = entity_ids.setdefault(kind, {})
+    if name not in ids:
+        ids[name] = max(ids.values(), default=0) + 1
+        save_entity_ids(entity_ids)
+        if kind in _entity_names:
+            _entity_names[kind][ids[name]] = name
+    return ids[name]
+
+
+def get_entity_name(kind: str, entity_id: int) -> Optional[str]:
+    if kind not in _entity_names:
+        rebuild_entity_registry(kind)
+    return _entity_names[kind].get(entity_id)
+
+
+def get_entity(kind: str, name: str) -> Optional[Dict]:
+    """Находит группу или преподавателя по названию за O(1)"""
+    return get_list_index(kind).by_name.get(name)
+
+
+def entity_callback(action: str, name: str, view: Optional[str] = None, page: int = 0) -> str:
+    """Кодирует действие с группой или преподавателем в короткий callback_data: префикс, код действия, ID в base64"""
+    code, kind = ENTITY_ACTIONS[action]
+    entity_id = get_entity_id(kind, name)
+    encoded = base64.urlsafe_b64encode(entity_id.to_bytes((entity_id.bit_length() + 7) // 8 or 1, 'big'))
+    data = f"{ENTITY_CALLBACK_PREFIX}{code}{encoded.decode('ascii').rstrip('=')}"
+    if page:
+        return f"{data}.{view or 'week'}.{page}"
+    return f"{data}.{view}" if view else data
+
+
+def parse_entity_callback(data: str) -> Optional[str]:
+    """Возвращает название из callback_data; понимает и старый формат «действие:название»"""
+    if not data.startswith(ENTITY_CALLBACK_PREFIX):
+        return data.split(":", 1)[1]
+    
+    kind = _ACTIONS_BY_CODE.get(data[1:2])
+    payload = data[2:].split('.', 1)[0]
+    try:
+        entity_id = int.from_bytes(base64.urlsafe_b64decode(payload + '=' * (-len(payload) % 4)), 'big')
+    except ValueError:
+        return None
+    return get_entity_name(kind, entity_id) if kind else None
+
+
+def parse_entity_view(data: str) -> str:
+    """Возвращает вид расписания из callback_data (по умолчанию — неделя)"""
+    if data.startswith(ENTITY_CALLBACK_PREFIX) and '.' in data:
+        view = data.split('.')[1]
+        if view in SCHEDULE_VIEWS:
+            return view
+    return 'week'
 
-def save_favorites(favorites):
-    with open(FAVORITES_FILE, 'w', encoding='utf-8') as f:
-        json.dump(favorites, f, ensure_ascii=False, indent=2)
+
+def parse_entity_page(data: str) -> int:
+    """Возвращает номер страницы расписания из callback_data"""
+    parts = data.split('.') if data.startswith(ENTITY_CALLBACK_PREFIX) else []
+    return int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+
+
+def entity_callback_filter(action: str):
+    """Фильтр callback-запросов действия в новом и старом форматах"""
+    code, _ = ENTITY_ACTIONS[action]
+    return F.data.startswith(f"{action}:") | F.data.startswith(f"{ENTITY_CALLBACK_PREFIX}{code}")
+
+
+KEYBOARD_CACHE_SIZE = 256
+
+
+_keyboard_cache: "OrderedDict[tuple, InlineKeyboardMarkup]" = OrderedDict()
+
+
+_favorites_by_user: Optional[Dict[str, Dict[str, set]]] = None
+_favorites_by_entity: Dict[tuple, set] = {}
+
+
+def _favorites_index() -> Dict[str, Dict[str, set]]:
+    """Строит двусторонний индекс избранного (пользователь → сущности, сущность → пользователи) один раз"""
+    global _favorites_by_user
+    
+    if _favorites_by_user is None:
+        _favorites_by_user = {}
+        _favorites_by_entity.clear()
+        for user_id, user_favorites in load_favorites().items():
+            for kind, names in user_favorites.items():
+                _favorites_by_user.setdefault(user_id, {})[kind] = set(names)
+                for name in names:
+                    _favorites_by_entity.setdefault((kind, name), set()).add(user_id)
+    return _favorites_by_user
+
+
+def get_user_favorites(user_id: str, kind: str) -> set:
+    """Возвращает множество избранных групп или преподавателей пользователя"""
+    return set(_favorites_index().get(user_id, {}).get(kind, ()))
+
+
+def get_favorite_subscribers(kind: str, name: str) -> set:
+    """Возвращает пользователей, у которых группа или преподаватель в избранном"""
+    _favorites_index()
+    return set(_favorites_by_entity.get((kind, name), ()))
+
+
+def add_favorite(user_id: str, kind: str, name: str) -> bool:
+    """Добавляет в избранное, обновляя хранилище и оба направления индекса; False, если уже было"""
+    user_index = _favorites_index().setdefault(user_id, {}).setdefault(kind, set())
+    if name in user_index:
+        return False
+    
+    favorites = load_favorites()
+    favorites.setdefault(user_id, {"groups": [], "teachers": []}).setdefault(kind, []).append(name)
+    save_favorites(favorites, changed=[user_id])
+    user_index.add(name)
+    _favorites_by_entity.setdefault((kind, name), set()).add(user_id)
+    return True
+
+
+def remove_favorite(user_id: str, kind: str, name: str) -> bool:
+    """Удаляет из избранного, обновляя хранилище и оба направления индекса; False, если не было"""
+    user_index = _favorites_index().get(user_id, {}).get(kind, set())
+    if name not in user_index:
+        return False
+    
+    favorites = load_favorites()
+    favorites[user_id][kind].remove(name)
+    save_favorites(favorites, changed=[user_id])
+    user_index.discard(name)
+    subscribers = _favorites_by_entity.get((kind, name), set())
+    subscribers.discard(user_id)
+    if not subscribers:
+        _favorites_by_entity.pop((kind, name), None)
+    return True
+
+
+def lru_get(store: OrderedDict, key: tuple, build, max_size: int) -> Any:
+    """Возвращает значение из LRU-кэша или строит и запоминает новое"""
+    value = store.get(key)
+    if value is not None:
+        store.move_to_end(key)
+        return value
+    
+    value = build()
+    store[key] = value
+    if len(store) > max_size:
+        store.popitem(last=False)
+    return value
+
+
+def _cached_keyboard(key: tuple, build) -> InlineKeyboardMarkup:
+    """Возвращает готовую клавиатуру из кэша или строит и запоминает новую"""
+    return lru_get(_keyboard_cache, key, build, KEYBOARD_CACHE_SIZE)
 
 
 def create_groups_keyboard(groups: List[Dict], page: int, groups_per_page: int = 30, 
-                          show_favorites: bool = False, user_id: str = None) -> InlineKeyboardMarkup:
+                          show_favorites: bool = False, favorites: Optional[set] = None) -> InlineKeyboardMarkup:
     """Создает клавиатуру с группами в 3 колонки"""
     start_idx = page * groups_per_page
     end_idx = start_idx + groups_per_page
-    page_groups = groups[start_idx:end_idx]
+    page_names = tuple(group.get('name', 'Без названия') for group in groups[start_idx:end_idx])
+    total_pages = (len(groups) + groups_per_page - 1) // groups_per_page
     
-    keyboard_buttons = []
-    row = []
+    favorite_names = frozenset()
+    if show_favorites and favorites:
+        favorite_names = frozenset(name for name in page_names if name in favorites)
     
-    for i, group in enumerate(page_groups):
-        group_name = group.get('name', 'Без названия')
-        
+    key = ('groups', page_names, page, total_pages, show_favorites, favorite_names)
+    return _cached_keyboard(
+        key, lambda: _build_groups_keyboard(page_names, page, total_pages, show_favorites, favorite_names)
+    )
 
-        is_favorite = False
-        if user_id and show_favorites:
-            favorites = load_favorites()
-            if user_id in favorites and group_name in favorites[user_id].get('groups', []):
-                is_favorite = True
-        
 
-        emoji = "⭐" if is_favorite else "👥"
+def _build_groups_keyboard(page_names: tuple, page: int, total_pages: int,
+                           show_favorites: bool, favorite_names: frozenset) -> InlineKeyboardMarkup:
+    """Строит клавиатуру страницы групп"""
+    keyboard_buttons = []
+    row = []
+    
+    for i, group_name in enumerate(page_names):
+        emoji = "⭐" if group_name in favorite_names else "👥"
         button = InlineKeyboardButton(
             text=f"{emoji} {group_name}",
-            callback_data=f"group:{group_name}"
+            callback_data=entity_callback('group', group_name)
         )
         row.append(button)
         
@@ -180,7 +878,6 @@ def create_groups_keyboard(groups: List[Dict], page: int, groups_per_page: int =
         keyboard_buttons.append(row)
     
 
-    total_pages = (len(groups) + groups_per_page - 1) // groups_per_page
     nav_buttons = []
     
     if page > 0:
@@ -202,6 +899,7 @@ def create_groups_keyboard(groups: List[Dict], page: int, groups_per_page: int =
     else:
         action_buttons.append(InlineKeyboardButton(text="⭐ Избранное", callback_data="favorite_groups"))
     
+    action_buttons.append(InlineKeyboardButton(text="🔍 Поиск", callback_data="search_groups"))
     action_buttons.append(InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh_groups"))
     
     keyboard_buttons.append(action_buttons)
@@ -215,29 +913,34 @@ def create_groups_keyboard(groups: List[Dict], page: int, groups_per_page: int =
 
 
 def create_teachers_keyboard(teachers: List[Dict], page: int, teachers_per_page: int = 30,
-                           show_favorites: bool = False, user_id: str = None) -> InlineKeyboardMarkup:
+                           show_favorites: bool = False, favorites: Optional[set] = None) -> InlineKeyboardMarkup:
     """Создает клавиатуру с преподавателями в 3 колонки"""
     start_idx = page * teachers_per_page
     end_idx = start_idx + teachers_per_page
-    page_teachers = teachers[start_idx:end_idx]
+    page_names = tuple(teacher.get('name', 'Без имени') for teacher in teachers[start_idx:end_idx])
+    total_pages = (len(teachers) + teachers_per_page - 1) // teachers_per_page
     
+    favorite_names = frozenset()
+    if show_favorites and favorites:
+        favorite_names = frozenset(name for name in page_names if name in favorites)
+    
+    key = ('teachers', page_names, page, total_pages, show_favorites, favorite_names)
+    return _cached_keyboard(
+        key, lambda: _build_teachers_keyboard(page_names, page, total_pages, show_favorites, favorite_names)
+    )
+
+
+def _build_teachers_keyboard(page_names: tuple, page: int, total_pages: int,
+                             show_favorites: bool, favorite_names: frozenset) -> InlineKeyboardMarkup:
+    """Строит клавиатуру страницы преподавателей"""
     keyboard_buttons = []
     row = []
     
-    for i, teacher in enumerate(page_teachers):
-        teacher_name = teacher.get('name', 'Без имени')
-        
-
-        is_favorite = False
-        if user_id and show_favorites:
-            favorites = load_favorites()
-            if user_id in favorites and teacher_name in favorites[user_id].get('teachers', []):
-                is_favorite = True
-        
-        emoji = "⭐" if is_favorite else "👨‍🏫"
+    for i, teacher_name in enumerate(page_names):
+        emoji = "⭐" if teacher_name in favorite_names else "👨‍🏫"
         button = InlineKeyboardButton(
             text=f"{emoji} {teacher_name}",
-            callback_data=f"teacher:{teacher_name}"
+            callback_data=entity_callback('teacher', teacher_name)
         )
         row.append(button)
         
@@ -248,7 +951,6 @@ def create_teachers_keyboard(teachers: List[Dict], page: int, teachers_per_page:
     if row:
         keyboard_buttons.append(row)
     
-    total_pages = (len(teachers) + teachers_per_page - 1) // teachers_per_page
     nav_buttons = []
     
     if page > 0:
@@ -269,6 +971,7 @@ def create_teachers_keyboard(teachers: List[Dict], page: int, teachers_per_page:
     else:
         action_buttons.append(InlineKeyboardButton(text="⭐ Избранное", callback_data="favorite_teachers"))
     
+    action_buttons.append(InlineKeyboardButton(text="🔍 Поиск", callback_data="search_teachers"))
     action_buttons.append(InlineKeyboardButton(text="🔄 Обновить", callback_data="refresh_teachers"))
     
     keyboard_buttons.append(action_buttons)
@@ -280,6 +983,46 @@ def create_teachers_keyboard(teachers: List[Dict], page: int, teachers_per_page:
     return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
 
 
+PARSER_BACKEND = 'lxml'
+BS4_FEATURES = 'lxml' if lxml_html is not None else 'html.parser'
+PARSER_EXECUTOR = 'process'
+PARSER_WORKERS = 2
+
+
+_parser_executor: Optional[Executor] = None
+
+
+def get_parser_executor() -> Executor:
+    """Возвращает пул для парсинга HTML (потоки или процессы согласно PARSER_EXECUTOR)"""
+    global _parser_executor
+    
+    if _parser_executor is None:
+        if PARSER_EXECUTOR == 'process':
+            _parser_executor = ProcessPoolExecutor(
+                max_workers=PARSER_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        else:
+            _parser_executor = ThreadPoolExecutor(max_workers=PARSER_WORKERS, thread_name_prefix='parser')
+        logger.info(f"Пул парсеров: {PARSER_EXECUTOR}, воркеров: {PARSER_WORKERS}")
+    return _parser_executor
+
+
+def shutdown_parser_executor():
+    """Останавливает пул парсеров"""
+    global _parser_executor
+    
+    if _parser_executor is not None:
+        _parser_executor.shutdown(wait=False, cancel_futures=True)
+        _parser_executor = None
+
+
+async def run_parser(func, *args) -> Any:
+    """Выполняет функцию парсинга в пуле, не блокируя цикл событий"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_parser_executor(), func, *args)
+
+
 def get_lesson_time(lesson_num: int, is_monday: bool = False) -> tuple:
     """Возвращает время начала и конца пары по номеру пары"""
     if is_monday:
@@ -293,8 +1036,13 @@ def get_lesson_time(lesson_num: int, is_monday: bool = False) -> tuple:
 
 
 async def parse_group_schedule_simple(html: str, group_name: str) -> Dict[str, Any]:
+    """Парсит расписание группы в пуле парсеров, не блокируя цикл событий"""
+    return await run_parser(parse_page, PARSER_BACKEND, 'parse_group_schedule', html, group_name)
+
+
+def parse_group_schedule_html(html: str, group_name: str) -> Dict[str, Any]:
     """Правильный парсинг расписания группы"""
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, BS4_FEATURES)
     
 
     title_tag = soup.find('h1')
@@ -447,8 +1195,13 @@ def process_day_lessons(row, day_data, day_index):
 
 
 async def parse_teacher_schedule_simple(html: str, teacher_name: str) -> Dict[str, Any]:
+    """Парсит расписание преподавателя в пуле парсеров, не блокируя цикл событий"""
+    return await run_parser(parse_page, PARSER_BACKEND, 'parse_teacher_schedule', html, teacher_name)
+
+
+def parse_teacher_schedule_html(html: str, teacher_name: str) -> Dict[str, Any]:
     """Правильный парсинг расписания преподавателя"""
-    soup = BeautifulSoup(html, 'html.parser')
+    soup = BeautifulSoup(html, BS4_FEATURES)
     
     title_tag = soup.find('h1')
     title = title_tag.text.strip() if title_tag else f"Преподаватель: {teacher_name}"
@@ -570,282 +1323,1061 @@ def process_teacher_day_lessons(row, day_data, day_index):
         })
 
 
-def format_group_schedule(schedule_data: Dict) -> str:
-    """Форматирует расписание группы в красивый текст"""
-    if 'error' in schedule_data:
-        return f"❌ {schedule_data['error']}"
+def parse_groups_list_html(html: str) -> List[Dict]:
+    """Парсит страницу со списком групп"""
+    soup = BeautifulSoup(html, BS4_FEATURES)
     
-    group_name = schedule_data.get('group', 'Неизвестная группа')
-    title = schedule_data.get('title', '')
+    groups = []
+    table = soup.find('table', class_='inf')
+    
+    if table:
+        rows = table.find_all('tr')[1:]
+        for row in rows:
+            link = row.find('a', class_='z0')
+            if link:
+                group_name = link.text.strip()
+                group_url = link.get('href', '')
+                filename = group_url if group_url.startswith('http') else group_url.split('/')[-1] if '/' in group_url else group_url
+                
+                groups.append({
+                    'name': group_name,
+                    'url': group_url,
+                    'filename': filename
+                })
     
+    return groups
 
-    result = f"📅 <b>{title}</b>\n"
-    result += "―" * 40 + "\n\n"
+
+def parse_teachers_list_html(html: str) -> List[Dict]:
+    """Парсит страницу со списком преподавателей"""
+    soup = BeautifulSoup(html, BS4_FEATURES)
     
-    days = schedule_data.get('days', [])
+    teachers = []
+    table = soup.find('table', class_='inf')
     
-    if not days:
-        result += "📭 <i>На этой неделе пар нет</i>\n\n"
-    else:
-
-        week_days = []
-        for i in range(7):
-            day_found = next((day for day in days if day.get('weekday_idx') == i), None)
-            if day_found:
-                week_days.append(day_found)
-            else:
-
-                week_days.append({
-                    'weekday': WEEKDAYS[i],
-                    'weekday_idx': i,
-                    'lessons': []
-                })
-        
-
-        for day in week_days:
-            weekday = day.get('weekday', 'Неизвестный день')
-            lessons = day.get('lessons', [])
-            
-
-            result += f"📌 <b>{weekday.upper()}</b>\n"
-            result += "―" * 35 + "\n"
-            
-            if not lessons:
-                result += "│ <i>Пар нет</i>\n"
-                result += "―" * 35 + "\n\n"
-                continue
+    if table:
+        rows = table.find_all('tr')[1:]
+        for row in rows:
+            link = row.find('a', class_='z0')
+            if link:
+                teacher_name = link.text.strip()
+                if teacher_name.lower() in ['ваканс', 'вакансия']:
+                    continue
+                    
+                teacher_url = link.get('href', '')
+                filename = teacher_url if teacher_url.startswith('http') else teacher_url.split('/')[-1] if '/' in teacher_url else teacher_url
                 
+                teachers.append({
+                    'name': teacher_name,
+                    'url': teacher_url,
+                    'filename': filename
+                })
+    
+    return teachers
 
-            for lesson in lessons:
-                lesson_num = lesson.get('number', '?')
-                subject = lesson.get('subject', 'Нет предмета').strip()
-                teacher = lesson.get('teacher', '').strip()
-                room = lesson.get('room', '').strip()
-                time_start = lesson.get('time_start', '??:??')
-                time_end = lesson.get('time_end', '??:??')
-                
 
-                result += f"<b>│ {lesson_num} пара</b> │ {time_start}-{time_end}\n"
-                result += f"<b>│ 📚</b> {subject}\n"
-                
-                if teacher:
-                    result += f"<b>│ 👨‍🏫</b> {teacher}\n"
-                
-                if room:
-                    result += f"<b>│ 🏢</b> {room}\n"
-                
-                result += "―" * 35 + "\n"
-            
-            result += "\n"
+class ParserBackend:
+    """Интерфейс движка парсинга страниц сайта колледжа"""
+    name = ''
     
-
-    last_update = schedule_data.get('last_update')
-    if last_update:
-        result += f"\n🔄 <i>{last_update}</i>"
-    else:
-        result += f"\n🔄 <i>Обновлено: {datetime.now().strftime('%d.%m.%Y %H:%M')}</i>"
+    def parse_group_schedule(self, html: str, group_name: str) -> Dict[str, Any]:
+        raise NotImplementedError
     
-
-    if len(result) > 4000:
-        result = result[:3900] + "\n\n... (сообщение обрезано)"
+    def parse_teacher_schedule(self, html: str, teacher_name: str) -> Dict[str, Any]:
+        raise NotImplementedError
     
-    return result
+    def parse_groups_list(self, html: str) -> List[Dict]:
+        raise NotImplementedError
+    
+    def parse_teachers_list(self, html: str) -> List[Dict]:
+        raise NotImplementedError
 
 
-def format_teacher_schedule(schedule_data: Dict) -> str:
-    """Форматирует расписание преподавателя в красивый текст"""
-    if 'error' in schedule_data:
-        return f"❌ {schedule_data['error']}"
+class BeautifulSoupBackend(ParserBackend):
+    """Эталонный движок на BeautifulSoup; дерево строит lxml, а без него — html.parser"""
+    name = 'bs4'
     
-    teacher_name = schedule_data.get('teacher', 'Неизвестный преподаватель')
-    title = schedule_data.get('title', '')
+    def parse_group_schedule(self, html: str, group_name: str) -> Dict[str, Any]:
+        return parse_group_schedule_html(html, group_name)
     
-    result = f"👨‍🏫 <b>{title}</b>\n"
-    result += "―" * 40 + "\n\n"
+    def parse_teacher_schedule(self, html: str, teacher_name: str) -> Dict[str, Any]:
+        return parse_teacher_schedule_html(html, teacher_name)
     
-    days = schedule_data.get('days', [])
+    def parse_groups_list(self, html: str) -> List[Dict]:
+        return parse_groups_list_html(html)
     
-    if not days:
-        result += "📭 <i>На этой неделе пар нет</i>\n\n"
-    else:
+    def parse_teachers_list(self, html: str) -> List[Dict]:
+        return parse_teachers_list_html(html)
 
-        week_days = []
-        for i in range(7):
-            day_found = next((day for day in days if day.get('weekday_idx') == i), None)
-            if day_found:
-                week_days.append(day_found)
-            else:
 
-                week_days.append({
-                    'weekday': WEEKDAYS[i],
-                    'weekday_idx': i,
-                    'lessons': []
-                })
-        
+def _lxml_has_class(element, class_name: str) -> bool:
+    return class_name in (element.get('class') or '').split()
 
-        for day in week_days:
-            weekday = day.get('weekday', 'Неизвестный день')
-            lessons = day.get('lessons', [])
-            
-            if not lessons:
-                continue
-                    
-            result += f"📌 <b>{weekday.upper()}</b>\n"
-            result += "―" * 35 + "\n"
-            
-            for lesson in lessons:
-                lesson_num = lesson.get('number', '?')
-                groups = lesson.get('groups', [])
-                subject = lesson.get('subject', 'Нет предмета').strip()
-                room = lesson.get('room', '').strip()
-                time_start = lesson.get('time_start', '??:??')
-                time_end = lesson.get('time_end', '??:??')
+
+def _lxml_find(root, tag: str, class_name: Optional[str] = None):
+    """Аналог soup.find(tag, class_=...) для дерева lxml"""
+    for element in root.iter(tag):
+        if class_name is None or _lxml_has_class(element, class_name):
+            return element
+    return None
+
+
+def _lxml_strings(element):
+    """Перебирает текстовые узлы элемента так же, как BeautifulSoup (без комментариев и скриптов)"""
+    if isinstance(element.tag, str) and element.tag not in ('script', 'style') and element.text:
+        yield element.text
+    for child in element:
+        yield from _lxml_strings(child)
+        if child.tail:
+            yield child.tail
+
+
+def _lxml_text(element, separator: str = '', strip: bool = True) -> str:
+    """Аналог get_text(strip=True, separator=...) из BeautifulSoup"""
+    if not strip:
+        return ''.join(_lxml_strings(element))
+    return separator.join(part.strip() for part in _lxml_strings(element) if part.strip())
+
+
+class LxmlBackend(ParserBackend):
+    """Быстрый движок на lxml: обходит строки таблицы за один проход"""
+    name = 'lxml'
+    
+    def _parse_schedule(self, html: str, title_default: str, entity_key: str,
+                        entity_name: str, process_row) -> Dict[str, Any]:
+        root = lxml_html.document_fromstring(html)
+        
+        title_tag = _lxml_find(root, 'h1')
+        title = _lxml_text(title_tag, strip=False).strip() if title_tag is not None else title_default
+        
+        schedule_table = _lxml_find(root, 'table', 'inf')
+        if schedule_table is None:
+            return {"error": "Не найдена таблица расписания"}
+        
+        update_div = _lxml_find(root, 'div', 'ref')
+        last_update = _lxml_text(update_div, strip=False).strip() if update_div is not None else None
+        
+        schedule_data = {
+            'title': title,
+            entity_key: entity_name,
+            'days': [],
+            'last_update': last_update
+        }
+        
+        current_day_index = -1
+        
+        for row in schedule_table.iter('tr'):
+            hd_cells = []
+            lesson_cell = None
+            for cell in row.iter('td'):
+                classes = (cell.get('class') or '').split()
+                if 'hd' in classes:
+                    hd_cells.append(cell)
+                if lesson_cell is None and 'ur' in classes:
+                    lesson_cell = cell
+            
+            if hd_cells and 'rowspan' in hd_cells[0].attrib:
+                current_day_index += 1
                 
-                result += f"<b>│ {lesson_num} пара</b> │ {time_start}-{time_end}\n"
-                result += f"<b>│ 📚</b> {subject}\n"
+                lines = [line.strip() for line in _lxml_text(hd_cells[0], '\n').split('\n') if line.strip()]
                 
-                if groups:
-                    groups_text = ", ".join([g for g in groups if g.strip()])
-                    if groups_text:
-                        result += f"<b>│ 👥</b> {groups_text}\n"
+                if len(lines) >= 2:
+                    day_name = get_full_day_name(lines[1])
+                else:
+                    day_name = WEEKDAYS[current_day_index] if current_day_index < len(WEEKDAYS) else f"День {current_day_index+1}"
                 
-                if room:
-                    result += f"<b>│ 🏢</b> {room}\n"
+                schedule_data['days'].append({
+                    'weekday': day_name,
+                    'weekday_idx': current_day_index,
+                    'lessons': []
+                })
+            elif current_day_index < 0:
+                continue
+            
+            process_row(hd_cells, lesson_cell, schedule_data['days'][-1], current_day_index)
+        
+        schedule_data['days'] = [day for day in schedule_data['days'] if day['lessons']]
+        
+        return schedule_data
+    
+    @staticmethod
+    def _lesson_number(cell) -> int:
+        lesson_num_match = re.search(r'(\d+)', _lxml_text(cell))
+        return int(lesson_num_match.group(1)) if lesson_num_match else 0
+    
+    @staticmethod
+    def _cell_links(lesson_cell) -> Dict[str, List]:
+        links = {'z1': [], 'z2': [], 'z3': []}
+        for link in lesson_cell.iter('a'):
+            for class_name in (link.get('class') or '').split():
+                if class_name in links:
+                    links[class_name].append(link)
+        return links
+    
+    def _process_group_row(self, hd_cells, lesson_cell, day_data, day_index):
+        lesson_num_cell = next((c for c in hd_cells if 'rowspan' not in c.attrib), None)
+        if lesson_num_cell is None or lesson_cell is None:
+            return
+        
+        lesson_num = self._lesson_number(lesson_num_cell)
+        
+        if not _lxml_text(lesson_cell):
+            return
+        
+        links = self._cell_links(lesson_cell)
+        subject = _lxml_text(links['z1'][0]) if links['z1'] else ''
+        room = _lxml_text(links['z2'][0]) if links['z2'] else ''
+        teacher = _lxml_text(links['z3'][0]) if links['z3'] else ''
+        
+        if not subject:
+            lines = [line.strip() for line in _lxml_text(lesson_cell, '\n').split('\n') if line.strip()]
+            if lines:
+                subject = lines[0]
+                if len(lines) > 1:
+                    teacher = lines[-1]
+        
+        if subject:
+            time_start, time_end = get_lesson_time(lesson_num, day_index == 0)
+            day_data['lessons'].append({
+                'number': lesson_num,
+                'subject': subject,
+                'teacher': teacher,
+                'room': room,
+                'time_start': time_start,
+                'time_end': time_end
+            })
+    
+    def _process_teacher_row(self, hd_cells, lesson_cell, day_data, day_index):
+        if not hd_cells or 'rowspan' in hd_cells[0].attrib or lesson_cell is None:
+            return
+        
+        lesson_num = self._lesson_number(hd_cells[0])
+        
+        if not _lxml_text(lesson_cell):
+            return
+        
+        links = self._cell_links(lesson_cell)
+        groups = [_lxml_text(link) for link in links['z1']]
+        room = _lxml_text(links['z2'][0]) if links['z2'] else ''
+        subject = _lxml_text(links['z3'][0]) if links['z3'] else ''
+        
+        if not subject:
+            lines = [line.strip() for line in _lxml_text(lesson_cell, '\n').split('\n') if line.strip()]
+            if lines:
+                subject = lines[-1]
+                if not groups and len(lines) > 1:
+                    groups = lines[:-1]
+        
+        if subject:
+            time_start, time_end = get_lesson_time(lesson_num, day_index == 0)
+            day_data['lessons'].append({
+                'number': lesson_num,
+                'groups': groups,
+                'subject': subject,
+                'room': room,
+                'time_start': time_start,
+                'time_end': time_end
+            })
+    
+    def parse_group_schedule(self, html: str, group_name: str) -> Dict[str, Any]:
+        return self._parse_schedule(html, f"Группа: {group_name}", 'group', group_name, self._process_group_row)
+    
+    def parse_teacher_schedule(self, html: str, teacher_name: str) -> Dict[str, Any]:
+        return self._parse_schedule(html, f"Преподаватель: {teacher_name}", 'teacher', teacher_name,
+                                    self._process_teacher_row)
+    
+    def _parse_list(self, html: str, skip_vacancies: bool) -> List[Dict]:
+        root = lxml_html.document_fromstring(html)
+        
+        items = []
+        table = _lxml_find(root, 'table', 'inf')
+        
+        if table is None:
+            return items
+        
+        for row in list(table.iter('tr'))[1:]:
+            link = _lxml_find(row, 'a', 'z0')
+            if link is None:
+                continue
+            
+            name = _lxml_text(link, strip=False).strip()
+            if skip_vacancies and name.lower() in ['ваканс', 'вакансия']:
+                continue
+            
+            url = link.get('href', '')
+            filename = url if url.startswith('http') else url.split('/')[-1] if '/' in url else url
+            
+            items.append({
+                'name': name,
+                'url': url,
+                'filename': filename
+            })
+        
+        return items
+    
+    def parse_groups_list(self, html: str) -> List[Dict]:
+        return self._parse_list(html, skip_vacancies=False)
+    
+    def parse_teachers_list(self, html: str) -> List[Dict]:
+        return self._parse_list(html, skip_vacancies=True)
+
+
+PARSER_BACKENDS: Dict[str, ParserBackend] = {
+    'bs4': BeautifulSoupBackend(),
+    'lxml': LxmlBackend(),
+}
+
+
+def get_parser_backend(name: str) -> ParserBackend:
+    """Возвращает движок парсинга по имени, при отсутствии lxml — BeautifulSoup"""
+    if name == 'lxml' and lxml_html is None:
+        name = 'bs4'
+    return PARSER_BACKENDS.get(name, PARSER_BACKENDS['bs4'])
+
+
+def parse_page(backend_name: str, method: str, *args) -> Any:
+    """Парсит страницу выбранным движком; при сбое быстрого движка повторяет через BeautifulSoup"""
+    backend = get_parser_backend(backend_name)
+    
+    try:
+        return getattr(backend, method)(*args)
+    except Exception as e:
+        if backend.name == 'bs4':
+            raise
+        logger.warning(f"Движок {backend.name} не смог разобрать страницу ({e}), используем bs4")
+        return getattr(PARSER_BACKENDS['bs4'], method)(*args)
+
+
+RENDER_CACHE_SIZE = 512
+RENDER_CACHE_MAX_CHARS = 2_000_000
+RENDER_EVICTION_SAMPLE = 8
+ACCESS_WINDOW = 24 * 60 * 60
+
+
+_render_cache: "OrderedDict[tuple, tuple]" = OrderedDict()
+_render_cache_chars = 0
+_access_stats: Dict[tuple, Dict[str, float]] = {}
+
+
+def record_schedule_access(kind: str, name: str, user_id: str, now: Optional[float] = None):
+    """Запоминает, что пользователь смотрел расписание; повторные просмотры и листание не накапливаются"""
+    _access_stats.setdefault((kind, name), {})[user_id] = now or time.time()
+
+
+def prune_access_stats(now: Optional[float] = None):
+    """Забывает просмотры старше ACCESS_WINDOW"""
+    now = now or time.time()
+    for key in list(_access_stats):
+        viewers = _access_stats[key]
+        for user_id in [user_id for user_id, seen in viewers.items() if now - seen >= ACCESS_WINDOW]:
+            del viewers[user_id]
+        if not viewers:
+            del _access_stats[key]
+
+
+def get_popularity(kind: str, name: str, now: Optional[float] = None) -> int:
+    """Сколько разных пользователей смотрели расписание за ACCESS_WINDOW или держат его в избранном"""
+    now = now or time.time()
+    viewers = {user_id for user_id, seen in _access_stats.get((kind, name), {}).items() if now - seen < ACCESS_WINDOW}
+    return len(viewers | get_favorite_subscribers(f"{kind}s", name))
+
+
+def get_rendered_pages(key: tuple, version: int, build) -> List[str]:
+    """Кэш отрисованных страниц: LRU по времени обращения, вытесняется наименее популярное из самых старых"""
+    global _render_cache_chars
+    
+    cached = _render_cache.get(key)
+    if cached is not None and cached[0] == version:
+        _render_cache.move_to_end(key)
+        return cached[1]
+    
+    pages = build()
+    if cached is not None:
+        _render_cache_chars -= sum(map(len, cached[1]))
+    _render_cache[key] = (version, pages)
+    _render_cache.move_to_end(key)
+    _render_cache_chars += sum(map(len, pages))
+    
+    now = time.time()
+    while len(_render_cache) > RENDER_CACHE_SIZE or (_render_cache_chars > RENDER_CACHE_MAX_CHARS and len(_render_cache) > 1):
+        candidates = [old_key for old_key in islice(_render_cache, RENDER_EVICTION_SAMPLE + 1) if old_key != key]
+        victim = min(candidates[:RENDER_EVICTION_SAMPLE], key=lambda old_key: get_popularity(old_key[0], old_key[1], now))
+        _render_cache_chars -= sum(map(len, _render_cache.pop(victim)[1]))
+    return pages
+
+
+WEEKDAYS_SHORT = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+SCHEDULE_VIEWS = {'week', 'today', 'tomorrow', 'now'} | {f"d{i}" for i in range(7)}
+
+
+def resolve_schedule_view(view: str, now: datetime) -> str:
+    """Переводит «сегодня»/«завтра» в конкретный день недели (d0–d6)"""
+    if view == 'today':
+        return f"d{now.weekday()}"
+    if view == 'tomorrow':
+        return f"d{(now.weekday() + 1) % 7}"
+    return view
+
+
+MESSAGE_LIMIT = 4000
+MESSAGE_TAG_RESERVE = 50
+DAY_BOUNDARY = "\n📌 "
+_HTML_TAG = re.compile(r'<(/?)([a-zA-Z]+)[^>]*>')
+
+
+def split_message(text: str, limit: int = MESSAGE_LIMIT, boundary: str = DAY_BOUNDARY) -> List[str]:
+    """Делит HTML-текст на страницы не длиннее limit: по границам дней, затем по строкам; теги не рвутся"""
+    pages = []
+    reopen = ""
+    
+    while len(reopen) + len(text) > limit:
+        budget = max(limit - len(reopen) - MESSAGE_TAG_RESERVE, 1)
+        cut = text.rfind(boundary, 0, budget)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, budget)
+        if cut <= 0:
+            cut = budget
+            tag_start = text.rfind('<', 0, cut)
+            if tag_start > text.rfind('>', 0, cut):
+                cut = tag_start
+            entity_start = text.rfind('&', 0, cut)
+            if entity_start > text.rfind(';', 0, cut):
+                cut = entity_start
+            if cut <= 0:
+                cut = budget
+        
+        chunk = reopen + text[:cut]
+        open_tags = []
+        for match in _HTML_TAG.finditer(chunk):
+            if not match.group(1):
+                open_tags.append((match.group(2).lower(), match.group(0)))
+            elif open_tags and open_tags[-1][0] == match.group(2).lower():
+                open_tags.pop()
+        
+        pages.append(chunk.rstrip("\n") + "".join(f"</{tag}>" for tag, _ in reversed(open_tags)))
+        reopen = "".join(opening for _, opening in open_tags)
+        text = text[cut:].lstrip("\n")
+    
+    pages.append(reopen + text)
+    return pages
+
+
+def forget_rendered_schedule(kind: str, name: str):
+    """Убирает отрисованные страницы сущности: новая запись кэша начинает версии заново"""
+    global _render_cache_chars
+    
+    for key in [key for key in _render_cache if key[0] == kind and key[1] == name]:
+        _render_cache_chars -= sum(map(len, _render_cache.pop(key)[1]))
+
+
+def render_schedule_pages(kind: str, name: str, view: str = 'week') -> Optional[List[str]]:
+    """Отрисовывает расписание из кэша постранично; страницы запоминаются по (сущность, вид, версия данных)"""
+    entry = get_cache_entry(load_cache()[f"{kind}s"], f"{kind}_{name}")
+    if not entry:
+        return None
+    
+    now = datetime.now()
+    view = resolve_schedule_view(view, now)
+    if view == 'now':
+        return split_message(format_next_lesson(kind, entry["data"], now))
+    
+    if view == 'week':
+        formatter = format_group_schedule if kind == 'group' else format_teacher_schedule
+        build = lambda: split_message(formatter(entry["data"]))
+    else:
+        build = lambda: split_message(format_day_schedule(kind, entry["data"], int(view[1:])))
+    
+    return get_rendered_pages((kind, name, view), entry.get("version", 0), build)
+
+
+def schedule_deep_link_payload(kind: str, name: str) -> str:
+    """Параметр /start для ссылки, открывающей расписание в боте"""
+    return f"{kind}_{get_entity_id(f'{kind}s', name)}"
+
+
+def parse_schedule_deep_link(payload: Optional[str]) -> Optional[tuple]:
+    """Разбирает параметр /start в (вид, название); None для чужих и устаревших ссылок"""
+    match = re.fullmatch(r'(group|teacher)_(\d+)', payload or '')
+    if not match:
+        return None
+    name = get_entity_name(f"{match.group(1)}s", int(match.group(2)))
+    return (match.group(1), name) if name else None
+
+
+def format_lesson(kind: str, lesson: Dict) -> str:
+    """Форматирует одну пару: номер и время, предмет, преподаватель или группы, аудитория"""
+    result = f"<b>│ {lesson.get('number', '?')} пара</b> │ {lesson.get('time_start', '??:??')}-{lesson.get('time_end', '??:??')}\n"
+    result += f"<b>│ 📚</b> {lesson.get('subject', 'Нет предмета').strip()}\n"
+    
+    if kind == 'group':
+        teacher = lesson.get('teacher', '').strip()
+        if teacher:
+            result += f"<b>│ 👨‍🏫</b> {teacher}\n"
+    else:
+        groups_text = ", ".join([g for g in lesson.get('groups', []) if g.strip()])
+        if groups_text:
+            result += f"<b>│ 👥</b> {groups_text}\n"
+    
+    room = lesson.get('room', '').strip()
+    if room:
+        result += f"<b>│ 🏢</b> {room}\n"
+    
+    return result
+
+
+def _schedule_footer(schedule_data: Dict) -> str:
+    last_update = schedule_data.get('last_update')
+    if last_update:
+        return f"\n🔄 <i>{last_update}</i>"
+    return f"\n🔄 <i>Обновлено: {datetime.now().strftime('%d.%m.%Y %H:%M')}</i>"
+
+
+def _schedule_header(kind: str, schedule_data: Dict) -> str:
+    return f"{'📅' if kind == 'group' else '👨‍🏫'} <b>{schedule_data.get('title', '')}</b>\n" + "―" * 40 + "\n\n"
+
+
+def format_day_schedule(kind: str, schedule_data: Dict, day_idx: int) -> str:
+    """Форматирует расписание на один день недели"""
+    if 'error' in schedule_data:
+        return f"❌ {schedule_data['error']}"
+    
+    day = next((day for day in schedule_data.get('days', []) if day.get('weekday_idx') == day_idx), None)
+    lessons = day.get('lessons', []) if day else []
+    
+    result = _schedule_header(kind, schedule_data)
+    result += f"📌 <b>{WEEKDAYS[day_idx].upper()}</b>\n"
+    result += "―" * 35 + "\n"
+    
+    if not lessons:
+        result += "│ <i>Пар нет</i>\n"
+        result += "―" * 35 + "\n"
+    
+    for lesson in lessons:
+        result += format_lesson(kind, lesson)
+        result += "―" * 35 + "\n"
+    
+    return result + _schedule_footer(schedule_data)
+
+
+def _lesson_minutes(value: str) -> Optional[int]:
+    match = re.match(r'(\d{1,2}):(\d{2})', value or '')
+    return int(match.group(1)) * 60 + int(match.group(2)) if match else None
+
+
+def format_next_lesson(kind: str, schedule_data: Dict, now: datetime) -> str:
+    """Показывает идущую сейчас или ближайшую следующую пару"""
+    if 'error' in schedule_data:
+        return f"❌ {schedule_data['error']}"
+    
+    days = {day.get('weekday_idx'): day.get('lessons', []) for day in schedule_data.get('days', [])}
+    minutes_now = now.hour * 60 + now.minute
+    result = _schedule_header(kind, schedule_data)
+    
+    for offset in range(7):
+        day_idx = (now.weekday() + offset) % 7
+        for lesson in days.get(day_idx, []):
+            start = _lesson_minutes(lesson.get('time_start'))
+            end = _lesson_minutes(lesson.get('time_end'))
+            if offset == 0 and (end is None or end <= minutes_now):
+                continue
+            
+            if offset == 0 and start is not None and start <= minutes_now:
+                result += f"🟢 <b>Сейчас идёт</b> (до конца {end - minutes_now} мин)\n"
+            elif offset == 0:
+                result += f"⏭ <b>Следующая пара сегодня</b> (через {start - minutes_now} мин)\n" if start is not None \
+                    else "⏭ <b>Следующая пара сегодня</b>\n"
+            else:
+                when = "завтра" if offset == 1 else WEEKDAYS[day_idx].lower()
+                result += f"⏭ <b>Следующая пара — {when}</b>\n"
+            
+            result += "―" * 35 + "\n"
+            result += format_lesson(kind, lesson)
+            result += "―" * 35 + "\n"
+            return result + _schedule_footer(schedule_data)
+    
+    result += "📭 <i>На этой неделе больше пар нет</i>\n"
+    return result + _schedule_footer(schedule_data)
+
+
+def format_group_schedule(schedule_data: Dict) -> str:
+    """Форматирует расписание группы в красивый текст"""
+    if 'error' in schedule_data:
+        return f"❌ {schedule_data['error']}"
+    
+    group_name = schedule_data.get('group', 'Неизвестная группа')
+    title = schedule_data.get('title', '')
+    
+
+    result = f"📅 <b>{title}</b>\n"
+    result += "―" * 40 + "\n\n"
+    
+    days = schedule_data.get('days', [])
+    
+    if not days:
+        result += "📭 <i>На этой неделе пар нет</i>\n\n"
+    else:
+
+        week_days = []
+        for i in range(7):
+            day_found = next((day for day in days if day.get('weekday_idx') == i), None)
+            if day_found:
+                week_days.append(day_found)
+            else:
+
+                week_days.append({
+                    'weekday': WEEKDAYS[i],
+                    'weekday_idx': i,
+                    'lessons': []
+                })
+        
+
+        for day in week_days:
+            weekday = day.get('weekday', 'Неизвестный день')
+            lessons = day.get('lessons', [])
+            
+
+            result += f"📌 <b>{weekday.upper()}</b>\n"
+            result += "―" * 35 + "\n"
+            
+            if not lessons:
+                result += "│ <i>Пар нет</i>\n"
+                result += "―" * 35 + "\n\n"
+                continue
                 
+
+            for lesson in lessons:
+                result += format_lesson('group', lesson)
                 result += "―" * 35 + "\n"
             
             result += "\n"
     
-    last_update = schedule_data.get('last_update')
-    if last_update:
-        result += f"\n🔄 <i>{last_update}</i>"
+
+    result += _schedule_footer(schedule_data)
+    
+    return result
+
+
+def format_teacher_schedule(schedule_data: Dict) -> str:
+    """Форматирует расписание преподавателя в красивый текст"""
+    if 'error' in schedule_data:
+        return f"❌ {schedule_data['error']}"
+    
+    teacher_name = schedule_data.get('teacher', 'Неизвестный преподаватель')
+    title = schedule_data.get('title', '')
+    
+    result = f"👨‍🏫 <b>{title}</b>\n"
+    result += "―" * 40 + "\n\n"
+    
+    days = schedule_data.get('days', [])
+    
+    if not days:
+        result += "📭 <i>На этой неделе пар нет</i>\n\n"
     else:
-        result += f"\n🔄 <i>Обновлено: {datetime.now().strftime('%d.%m.%Y %H:%M')}</i>"
+
+        week_days = []
+        for i in range(7):
+            day_found = next((day for day in days if day.get('weekday_idx') == i), None)
+            if day_found:
+                week_days.append(day_found)
+            else:
+
+                week_days.append({
+                    'weekday': WEEKDAYS[i],
+                    'weekday_idx': i,
+                    'lessons': []
+                })
+        
+
+        for day in week_days:
+            weekday = day.get('weekday', 'Неизвестный день')
+            lessons = day.get('lessons', [])
+            
+            if not lessons:
+                continue
+                    
+            result += f"📌 <b>{weekday.upper()}</b>\n"
+            result += "―" * 35 + "\n"
+            
+            for lesson in lessons:
+                result += format_lesson('teacher', lesson)
+                result += "―" * 35 + "\n"
+            
+            result += "\n"
     
-    if len(result) > 4000:
-        result = result[:3900] + "\n\n... (сообщение обрезано)"
+    result += _schedule_footer(schedule_data)
     
     return result
 
 
-async def fetch_group_schedule(group_name: str, group_filename: str) -> Dict:
-    """Получает и парсит расписание группы"""
+HTTP_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.9',
+    'Connection': 'keep-alive',
+}
+HTTP_POOL_LIMIT = 20
+HTTP_POOL_LIMIT_PER_HOST = 8
+HTTP_DNS_CACHE_TTL = 300
+HTTP_KEEPALIVE_TIMEOUT = 60
+
+
+_http_session: Optional[aiohttp.ClientSession] = None
+
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Возвращает общую сессию с пулом соединений к сайту колледжа"""
+    global _http_session
+    
+    if _http_session is None or _http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_POOL_LIMIT,
+            limit_per_host=HTTP_POOL_LIMIT_PER_HOST,
+            ttl_dns_cache=HTTP_DNS_CACHE_TTL,
+            keepalive_timeout=HTTP_KEEPALIVE_TIMEOUT
+        )
+        _http_session = aiohttp.ClientSession(connector=connector, headers=HTTP_HEADERS)
+    return _http_session
+
+
+async def close_http_session():
+    """Закрывает общую HTTP-сессию при остановке бота"""
+    global _http_session
+    
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+async def fetch_page(url: str, timeout: int, conditional: bool = False) -> tuple:
+    """Загружает страницу, возвращает (статус, html, валидаторы); 304 означает, что страница не изменилась"""
+    known = load_validators().get(url, {}) if conditional else {}
+    
+    request_headers = {}
+    if known.get("etag"):
+        request_headers['If-None-Match'] = known["etag"]
+    if known.get("last_modified"):
+        request_headers['If-Modified-Since'] = known["last_modified"]
+    
+    session = get_http_session()
+    async with session.get(url, timeout=timeout, headers=request_headers) as response:
+        if response.status == 304:
+            return 304, None, None
+        if response.status != 200:
+            return response.status, None, None
+        
+        body = await response.read()
+        content_hash = hashlib.sha1(body).hexdigest()
+        
+        validator = {
+            "etag": response.headers.get('ETag'),
+            "last_modified": response.headers.get('Last-Modified'),
+            "content_hash": content_hash
+        }
+        
+        if conditional and known.get("content_hash") == content_hash:
+            return 304, None, validator
+        
+        try:
+            html = body.decode('windows-1251')
+        except UnicodeDecodeError:
+            html = await response.text()
+        
+        return 200, html, validator
+
+
+def save_page_validator(url: str, validator: Optional[Dict]):
+    """Запоминает валидаторы страницы; вызывается только после того, как её содержимое разобрано и сохранено"""
+    if not validator:
+        return
+    
+    validators = load_validators()
+    validators[url] = validator
+    save_validators(validators, changed=[url])
+
+
+async def fetch_group_schedule(group_name: str, group_filename: str, conditional: bool = False) -> tuple:
+    """Получает и парсит расписание группы, возвращает (данные, валидаторы); при conditional не парсит неизменившуюся страницу"""
     try:
         schedule_url = f"{BASE_URL}/{group_filename}"
         
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'ru-RU,ru;q=0.9',
-                'Connection': 'keep-alive',
-            }
-            
-            async with session.get(schedule_url, timeout=15, headers=headers) as response:
-                if response.status == 200:
-
-                    try:
-                        html = await response.text(encoding='windows-1251')
-                    except:
-                        try:
-                            html = await response.text(encoding='cp1251')
-                        except:
-                            html = await response.text()
-                    
-                    logger.info(f"Загружено расписание для группы {group_name}")
-                    return await parse_group_schedule_simple(html, group_name)
-                else:
-                    logger.error(f"Ошибка HTTP {response.status} для {schedule_url}")
-                    return {"error": f"Ошибка при загрузке страницы: {response.status}"}
+        status, html, validator = await fetch_page(schedule_url, 15, conditional)
+        if status == 304:
+            logger.info(f"Расписание группы {group_name} не изменилось")
+            return {"not_modified": True}, validator
+        if status == 200:
+            logger.info(f"Загружено расписание для группы {group_name}")
+            return await parse_group_schedule_simple(html, group_name), validator
+        else:
+            logger.error(f"Ошибка HTTP {status} для {schedule_url}")
+            return {"error": f"Ошибка при загрузке страницы: {status}"}, None
     except asyncio.TimeoutError:
         logger.error(f"Таймаут при загрузке расписания группы {group_name}")
-        return {"error": "Таймаут при загрузке. Сайт может быть недоступен."}
+        return {"error": "Таймаут при загрузке. Сайт может быть недоступен."}, None
     except Exception as e:
         logger.error(f"Ошибка при получении расписания группы {group_name}: {e}")
-        return {"error": f"Ошибка при загрузке расписания: {str(e)[:200]}"}
+        return {"error": f"Ошибка при загрузке расписания: {str(e)[:200]}"}, None
 
 
-async def fetch_teacher_schedule(teacher_name: str, teacher_filename: str) -> Dict:
-    """Получает и парсит расписание преподавателя"""
+async def fetch_teacher_schedule(teacher_name: str, teacher_filename: str, conditional: bool = False) -> tuple:
+    """Получает и парсит расписание преподавателя, возвращает (данные, валидаторы); при conditional не парсит неизменившуюся страницу"""
     try:
         schedule_url = f"{BASE_URL}/{teacher_filename}"
         
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'ru-RU,ru;q=0.9',
-                'Connection': 'keep-alive',
-            }
-            
-            async with session.get(schedule_url, timeout=15, headers=headers) as response:
-                if response.status == 200:
-                    try:
-                        html = await response.text(encoding='windows-1251')
-                    except:
-                        try:
-                            html = await response.text(encoding='cp1251')
-                        except:
-                            html = await response.text()
-                    
-                    logger.info(f"Загружено расписание для преподавателя {teacher_name}")
-                    return await parse_teacher_schedule_simple(html, teacher_name)
-                else:
-                    return {"error": f"Ошибка при загрузке страницы: {response.status}"}
+        status, html, validator = await fetch_page(schedule_url, 15, conditional)
+        if status == 304:
+            logger.info(f"Расписание преподавателя {teacher_name} не изменилось")
+            return {"not_modified": True}, validator
+        if status == 200:
+            logger.info(f"Загружено расписание для преподавателя {teacher_name}")
+            return await parse_teacher_schedule_simple(html, teacher_name), validator
+        else:
+            return {"error": f"Ошибка при загрузке страницы: {status}"}, None
     except Exception as e:
         logger.error(f"Ошибка при получении расписания преподавателя {teacher_name}: {e}")
-        return {"error": f"Ошибка при загрузке расписания: {str(e)[:200]}"}
+        return {"error": f"Ошибка при загрузке расписания: {str(e)[:200]}"}, None
+
+
+SCHEDULE_TTL = 30 * 60
+
+
+_background_tasks = set()
+
+
+def run_in_background(coro) -> asyncio.Task:
+    """Запускает корутину в фоне, сохраняя ссылку на задачу до её завершения"""
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def get_cache_entry(section: Dict, cache_key: str) -> Optional[Dict]:
+    """Возвращает запись кэша расписаний; записи старого формата без данных игнорируются"""
+    entry = section.get(cache_key)
+    if not isinstance(entry, dict) or "data" not in entry:
+        return None
+    return entry
+
+
+SCHEDULE_CHANGES_HISTORY = 5
+
+
+def _lessons_by_slot(schedule_data: Dict) -> Dict[tuple, List[Dict]]:
+    slots = {}
+    for day in schedule_data.get('days', []):
+        for lesson in day.get('lessons', []):
+            slots.setdefault((day.get('weekday_idx'), lesson.get('number')), []).append(lesson)
+    return slots
+
+
+def _lesson_subject(lesson: Dict) -> str:
+    return lesson.get('subject', '').strip().lower()
+
+
+def _lesson_identity(lesson: Dict) -> tuple:
+    return (_lesson_subject(lesson), lesson.get('teacher', '').strip(), tuple(lesson.get('groups', [])))
+
+
+def _lesson_change(change_type: str, slot: tuple, lesson: Dict, **details) -> Dict:
+    return dict({"type": change_type, "day": slot[0], "number": slot[1],
+                 "subject": lesson.get('subject', '').strip()}, **details)
+
+
+def diff_schedules(old_data: Dict, new_data: Dict) -> List[Dict]:
+    """Сравнивает два разбора расписания по парам: added, removed, moved, room, teacher, groups"""
+    old_slots = _lessons_by_slot(old_data)
+    new_slots = _lessons_by_slot(new_data)
+    changes = []
+    removed = []
+    added = []
+    
+    for slot in sorted(set(old_slots) | set(new_slots), key=lambda slot: (slot[0] or 0, slot[1] or 0)):
+        new_lessons = list(new_slots.get(slot, []))
+        for old_lesson in old_slots.get(slot, []):
+            match = next((lesson for lesson in new_lessons if _lesson_subject(lesson) == _lesson_subject(old_lesson)), None)
+            if match is None:
+                removed.append((slot, old_lesson))
+                continue
+            
+            new_lessons.remove(match)
+            for field in ('room', 'teacher', 'groups'):
+                if old_lesson.get(field) != match.get(field):
+                    changes.append(_lesson_change(field, slot, match, old=old_lesson.get(field), new=match.get(field)))
+        added.extend((slot, lesson) for lesson in new_lessons)
+    
+    for old_slot, old_lesson in removed:
+        target = next((item for item in added if _lesson_identity(item[1]) == _lesson_identity(old_lesson)), None)
+        if target is None:
+            changes.append(_lesson_change('removed', old_slot, old_lesson))
+            continue
+        
+        added.remove(target)
+        new_slot, new_lesson = target
+        changes.append(_lesson_change('moved', new_slot, new_lesson, from_day=old_slot[0], from_number=old_slot[1],
+                                      old=old_lesson.get('room'), new=new_lesson.get('room')))
+    
+    changes.extend(_lesson_change('added', slot, lesson) for slot, lesson in added)
+    return changes
+
+
+def store_cache_entry(section: Dict, cache_key: str, schedule_data: Dict, filename: str) -> List[Dict]:
+    """Кладёт расписание в кэш, увеличивая версию при изменении данных; возвращает изменения по парам"""
+    previous = get_cache_entry(section, cache_key)
+    version = previous.get("version", 0) if previous else 0
+    history = previous.get("changes", []) if previous else []
+    changes = []
+    
+    if not previous:
+        forget_rendered_schedule(*cache_key.split('_', 1))
+    
+    if not previous or previous["data"] != schedule_data:
+        version += 1
+        if previous:
+            changes = diff_schedules(previous["data"], schedule_data)
+        if changes:
+            history = (history + [{"version": version, "detected_at": time.time(), "items": changes}])[-SCHEDULE_CHANGES_HISTORY:]
+            logger.info(f"Расписание {cache_key} изменилось (версия {version}): {len(changes)} изменений")
+    
+    section[cache_key] = {
+        "data": schedule_data,
+        "filename": filename,
+        "fetched_at": time.time(),
+        "version": version,
+        "changes": history
+    }
+    return changes
+
+
+def is_cache_entry_fresh(entry: Dict) -> bool:
+    """Проверяет, не истёк ли срок жизни записи кэша"""
+    return time.time() - entry.get("fetched_at", 0) < SCHEDULE_TTL
+
+
+def find_group(group_name: str) -> Optional[Dict]:
+    """Ищет группу в кэше списка групп"""
+    return get_entity('groups', group_name)
+
+
+def find_teacher(teacher_name: str) -> Optional[Dict]:
+    """Ищет преподавателя в кэше списка преподавателей"""
+    return get_entity('teachers', teacher_name)
+
+
+_inflight_fetches: Dict[str, asyncio.Task] = {}
+
+
+async def single_flight(key: str, factory) -> Any:
+    """Объединяет одновременные одинаковые загрузки: все вызовы ждут одну задачу"""
+    task = _inflight_fetches.get(key)
+    
+    if task is None:
+        task = asyncio.create_task(factory())
+        _inflight_fetches[key] = task
+        
+        def forget(done_task):
+            if _inflight_fetches.get(key) is done_task:
+                del _inflight_fetches[key]
+        
+        task.add_done_callback(forget)
+    
+    return await asyncio.shield(task)
+
+
+async def load_group_schedule(group_name: str, group_filename: str) -> Dict:
+    """Загружает расписание группы и кладёт его в кэш, объединяя одновременные запросы"""
+    async def fetch_and_store():
+        cache = load_cache()
+        cache_key = f"group_{group_name}"
+        entry = get_cache_entry(cache["groups"], cache_key)
+        conditional = bool(entry and entry.get("filename") == group_filename)
+        
+        schedule_data, validator = await fetch_group_schedule(group_name, group_filename, conditional)
+        
+        if schedule_data.get('not_modified'):
+            current = get_cache_entry(cache["groups"], cache_key)
+            if current:
+                current["fetched_at"] = time.time()
+                save_cache(cache, changed=[("groups", cache_key)])
+                save_page_validator(f"{BASE_URL}/{group_filename}", validator)
+                return current["data"]
+            schedule_data, validator = await fetch_group_schedule(group_name, group_filename)
+        
+        if 'error' not in schedule_data:
+            changes = store_cache_entry(cache["groups"], cache_key, schedule_data, group_filename)
+            if changes:
+                run_in_background(notify_schedule_change('group', group_name, changes))
+            cache["last_update"] = datetime.now().strftime("%d.%m.%Y %H:%M")
+            save_cache(cache, changed=[("groups", cache_key)])
+            save_page_validator(f"{BASE_URL}/{group_filename}", validator)
+        
+        return schedule_data
+    
+    return await single_flight(f"group:{group_filename}", fetch_and_store)
+
+
+async def load_teacher_schedule(teacher_name: str, teacher_filename: str) -> Dict:
+    """Загружает расписание преподавателя и кладёт его в кэш, объединяя одновременные запросы"""
+    async def fetch_and_store():
+        cache = load_cache()
+        cache_key = f"teacher_{teacher_name}"
+        entry = get_cache_entry(cache["teachers"], cache_key)
+        conditional = bool(entry and entry.get("filename") == teacher_filename)
+        
+        schedule_data, validator = await fetch_teacher_schedule(teacher_name, teacher_filename, conditional)
+        
+        if schedule_data.get('not_modified'):
+            current = get_cache_entry(cache["teachers"], cache_key)
+            if current:
+                current["fetched_at"] = time.time()
+                save_cache(cache, changed=[("teachers", cache_key)])
+                save_page_validator(f"{BASE_URL}/{teacher_filename}", validator)
+                return current["data"]
+            schedule_data, validator = await fetch_teacher_schedule(teacher_name, teacher_filename)
+        
+        if 'error' not in schedule_data:
+            changes = store_cache_entry(cache["teachers"], cache_key, schedule_data, teacher_filename)
+            if changes:
+                run_in_background(notify_schedule_change('teacher', teacher_name, changes))
+            cache["last_update"] = datetime.now().strftime("%d.%m.%Y %H:%M")
+            save_cache(cache, changed=[("teachers", cache_key)])
+            save_page_validator(f"{BASE_URL}/{teacher_filename}", validator)
+        
+        return schedule_data
+    
+    return await single_flight(f"teacher:{teacher_filename}", fetch_and_store)
 
 
 async def fetch_groups_list():
     """Получает список всех групп с сайта"""
     try:
         url = f"{BASE_URL}/cg.htm"
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'ru-RU,ru;q=0.9',
-                'Connection': 'keep-alive',
-            }
+        groups_cache = load_groups_cache()
+        
+        status, html, validator = await fetch_page(url, 10, conditional=bool(groups_cache.get("groups")))
+        if status == 304:
+            groups_cache["last_update"] = datetime.now().strftime("%d.%m.%Y %H:%M")
+            save_groups_cache(groups_cache)
+            save_page_validator(url, validator)
+            logger.info(f"Список групп не изменился")
+            return groups_cache["groups"]
+        if status == 200:
+            groups = await run_parser(parse_page, PARSER_BACKEND, 'parse_groups_list', html)
+            if not groups and groups_cache.get("groups"):
+                logger.warning(f"Страница списка групп пуста, оставляем сохранённый список")
+                return groups_cache["groups"]
             
-            async with session.get(url, timeout=10, headers=headers) as response:
-                if response.status == 200:
-                    try:
-                        html = await response.text(encoding='windows-1251')
-                    except:
-                        html = await response.text()
-                    
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    groups = []
-                    table = soup.find('table', class_='inf')
-                    
-                    if table:
-                        rows = table.find_all('tr')[1:]
-                        for row in rows:
-                            link = row.find('a', class_='z0')
-                            if link:
-                                group_name = link.text.strip()
-                                group_url = link.get('href', '')
-                                filename = group_url if group_url.startswith('http') else group_url.split('/')[-1] if '/' in group_url else group_url
-                                
-                                groups.append({
-                                    'name': group_name,
-                                    'url': group_url,
-                                    'filename': filename
-                                })
-                    
-                    save_groups_cache({
-                        "last_update": datetime.now().strftime("%d.%m.%Y %H:%M"),
-                        "groups": groups
-                    })
-                    
-                    logger.info(f"Загружено {len(groups)} групп")
-                    return groups
-                else:
-                    logger.error(f"Ошибка HTTP при получении групп: {response.status}")
-                    return []
+            save_groups_cache({
+                "last_update": datetime.now().strftime("%d.%m.%Y %H:%M"),
+                "groups": groups
+            })
+            if groups:
+                save_page_validator(url, validator)
+            
+            logger.info(f"Загружено {len(groups)} групп")
+            return groups
+        else:
+            logger.error(f"Ошибка HTTP при получении групп: {status}")
+            return []
     except Exception as e:
         logger.error(f"Ошибка при получении списка групп: {e}")
         return []
@@ -855,67 +2387,265 @@ async def fetch_teachers_list():
     """Получает список всех преподавателей с сайта"""
     try:
         url = f"{BASE_URL}/cp.htm"
-        async with aiohttp.ClientSession() as session:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                'Accept-Language': 'ru-RU,ru;q=0.9',
-                'Connection': 'keep-alive',
-            }
+        teachers_cache = load_teachers_cache()
+        
+        status, html, validator = await fetch_page(url, 10, conditional=bool(teachers_cache.get("teachers")))
+        if status == 304:
+            teachers_cache["last_update"] = datetime.now().strftime("%d.%m.%Y %H:%M")
+            save_teachers_cache(teachers_cache)
+            save_page_validator(url, validator)
+            logger.info(f"Список преподавателей не изменился")
+            return teachers_cache["teachers"]
+        if status == 200:
+            teachers = await run_parser(parse_page, PARSER_BACKEND, 'parse_teachers_list', html)
+            if not teachers and teachers_cache.get("teachers"):
+                logger.warning(f"Страница списка преподавателей пуста, оставляем сохранённый список")
+                return teachers_cache["teachers"]
             
-            async with session.get(url, timeout=10, headers=headers) as response:
-                if response.status == 200:
-                    try:
-                        html = await response.text(encoding='windows-1251')
-                    except:
-                        html = await response.text()
-                    
-                    soup = BeautifulSoup(html, 'html.parser')
-                    
-                    teachers = []
-                    table = soup.find('table', class_='inf')
-                    
-                    if table:
-                        rows = table.find_all('tr')[1:]
-                        for row in rows:
-                            link = row.find('a', class_='z0')
-                            if link:
-                                teacher_name = link.text.strip()
-                                if teacher_name.lower() in ['ваканс', 'вакансия']:
-                                    continue
-                                    
-                                teacher_url = link.get('href', '')
-                                filename = teacher_url if teacher_url.startswith('http') else teacher_url.split('/')[-1] if '/' in teacher_url else teacher_url
-                                
-                                teachers.append({
-                                    'name': teacher_name,
-                                    'url': teacher_url,
-                                    'filename': filename
-                                })
-                    
-                    save_teachers_cache({
-                        "last_update": datetime.now().strftime("%d.%m.%Y %H:%M"),
-                        "teachers": teachers
-                    })
-                    
-                    logger.info(f"Загружено {len(teachers)} преподавателей")
-                    return teachers
-                else:
-                    logger.error(f"Ошибка HTTP при получении преподавателей: {response.status}")
-                    return []
+            save_teachers_cache({
+                "last_update": datetime.now().strftime("%d.%m.%Y %H:%M"),
+                "teachers": teachers
+            })
+            if teachers:
+                save_page_validator(url, validator)
+            
+            logger.info(f"Загружено {len(teachers)} преподавателей")
+            return teachers
+        else:
+            logger.error(f"Ошибка HTTP при получении преподавателей: {status}")
+            return []
     except Exception as e:
         logger.error(f"Ошибка при получении списка преподавателей: {e}")
         return []
 
 
+SEARCH_RESULTS_LIMIT = 10
+SEARCH_MIN_TRIGRAM_SCORE = 0.3
+
+_LATIN_LAYOUT = "qwertyuiop[]asdfghjkl;'zxcvbnm,.`"
+_CYRILLIC_LAYOUT = "йцукенгшщзхъфывапролджэячсмитьбюё"
+_TO_CYRILLIC = str.maketrans(_LATIN_LAYOUT, _CYRILLIC_LAYOUT)
+_TO_LATIN = str.maketrans(_CYRILLIC_LAYOUT, _LATIN_LAYOUT)
+
+
+def normalize_search_text(text: str) -> str:
+    """Приводит строку к виду для поиска: нижний регистр, ё→е, без пунктуации"""
+    text = text.lower().replace('ё', 'е')
+    return ' '.join(re.findall(r'\w+', text))
+
+
+def _trigrams(text: str) -> set:
+    padded = f"  {text.replace(' ', '')} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Индекс названий для нечёткого поиска: префиксы, триграммы и раскладка клавиатуры"""
+    
+    def __init__(self, names: List[str]):
+        self.names = names
+        self.normalized = [normalize_search_text(name) for name in names]
+        self.compact = [text.replace(' ', '') for text in self.normalized]
+        self.prefixes = sorted(
+            {(word, i) for i, text in enumerate(self.normalized) for word in text.split()}
+            | {(text, i) for i, text in enumerate(self.compact)}
+        )
+        self.trigrams: Dict[str, List[int]] = {}
+        self.trigram_counts = []
+        for i, text in enumerate(self.normalized):
+            grams = _trigrams(text)
+            self.trigram_counts.append(len(grams))
+            for gram in grams:
+                self.trigrams.setdefault(gram, []).append(i)
+    
+    def _prefix_matches(self, prefix: str) -> set:
+        start = bisect.bisect_left(self.prefixes, (prefix, -1))
+        matches = set()
+        for word, i in self.prefixes[start:]:
+            if not word.startswith(prefix):
+                break
+            matches.add(i)
+        return matches
+    
+    def _score_variant(self, query: str, scores: Dict[int, float]):
+        compact = query.replace(' ', '')
+        if not compact:
+            return
+        
+        for i in self._prefix_matches(compact):
+            scores[i] = max(scores.get(i, 0), 3.0 if self.compact[i] == compact else 2.0)
+        
+        words = query.split()
+        if len(words) > 1:
+            candidates = set.intersection(*(self._prefix_matches(word) for word in words))
+            for i in candidates:
+                scores[i] = max(scores.get(i, 0), 1.5)
+        
+        grams = _trigrams(query)
+        shared: Dict[int, int] = {}
+        for gram in grams:
+            for i in self.trigrams.get(gram, ()):
+                shared[i] = shared.get(i, 0) + 1
+        for i, count in shared.items():
+            similarity = count / (len(grams) + self.trigram_counts[i] - count)
+            if similarity >= SEARCH_MIN_TRIGRAM_SCORE:
+                scores[i] = max(scores.get(i, 0), similarity)
+    
+    def search(self, query: str, limit: int = SEARCH_RESULTS_LIMIT) -> List[str]:
+        """Возвращает до limit названий, лучше всего подходящих под запрос"""
+        query = query.lower()
+        scores: Dict[int, float] = {}
+        for variant in {query, query.translate(_TO_CYRILLIC), query.translate(_TO_LATIN)}:
+            self._score_variant(normalize_search_text(variant), scores)
+        
+        best = sorted(scores.items(), key=lambda item: (-item[1], len(self.names[item[0]]), self.names[item[0]]))
+        return [self.names[i] for i, _ in best[:limit]]
+
+
+_search_indexes: Dict[str, SearchIndex] = {}
+
+
+def rebuild_search_index(kind: str) -> SearchIndex:
+    """Перестраивает поисковый индекс по текущему списку групп или преподавателей"""
+    if kind == 'groups':
+        names = [group.get('name', '') for group in load_groups_cache().get('groups', [])]
+    else:
+        names = [teacher.get('name', '') for teacher in load_teachers_cache().get('teachers', [])]
+    
+    _search_indexes[kind] = SearchIndex(names)
+    return _search_indexes[kind]
+
+
+def get_search_index(kind: str) -> SearchIndex:
+    index = _search_indexes.get(kind)
+    if index is None:
+        index = rebuild_search_index(kind)
+    return index
+
+
+PREFETCH_INTERVAL = 60 * 60
+PREFETCH_HOT_INTERVAL = 5 * 60
+PREFETCH_HOT_LIMIT = 30
+PREFETCH_HOT_SCORE = 3
+PREFETCH_RUSH_HOT_SCORE = 1
+PREFETCH_RUSH_WINDOW = 60 * 60
+PREFETCH_CONCURRENCY = 3
+PREFETCH_REQUEST_DELAY = 0.5
+
+
+def get_rush_window(day: datetime) -> Optional[tuple]:
+    """Возвращает окно перед первой парой дня, когда расписания обновляются чаще"""
+    weekday = day.weekday()
+    if weekday == 6:
+        return None
+    
+    bells = BELLS['monday'] if weekday == 0 else BELLS['other']
+    hours, minutes = map(int, bells[0][0].split(':'))
+    first_lesson = day.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+    return first_lesson - timedelta(seconds=PREFETCH_RUSH_WINDOW), first_lesson
+
+
+def is_rush_hour(now: datetime) -> bool:
+    """Проверяет, идёт ли сейчас окно перед первой парой"""
+    window = get_rush_window(now)
+    return bool(window and window[0] <= now < window[1])
+
+
+def select_hot_entities(ranked: List[tuple], rush: bool) -> set:
+    """Отбирает из отсортированных (популярность, вид, название) расписания для частого обновления"""
+    min_score = PREFETCH_RUSH_HOT_SCORE if rush else PREFETCH_HOT_SCORE
+    return {(kind, name) for score, kind, name in ranked[:PREFETCH_HOT_LIMIT] if score >= min_score}
+
+
+_lists_refreshed_at = 0.0
+
+
+async def prefetch_all_schedules():
+    """Прогревает кэш: обновляет расписания по приоритету популярности с ограничением нагрузки на сайт"""
+    global _lists_refreshed_at
+    
+    groups = load_groups_cache().get("groups", [])
+    teachers = load_teachers_cache().get("teachers", [])
+    if time.time() - _lists_refreshed_at >= PREFETCH_INTERVAL or not groups or not teachers:
+        groups = await fetch_groups_list() or groups
+        teachers = await fetch_teachers_list() or teachers
+        _lists_refreshed_at = time.time()
+    cache = load_cache()
+    
+    semaphore = asyncio.Semaphore(PREFETCH_CONCURRENCY)
+    politeness_lock = asyncio.Lock()
+    last_request = [0.0]
+    refreshed = [0]
+    now = time.time()
+    prune_access_stats(now)
+    
+    async def refresh(loader, section: str, cache_key: str, name: str, filename: str, interval: float):
+        entry = get_cache_entry(cache[section], cache_key)
+        if entry and now - entry.get("fetched_at", 0) < interval:
+            return
+        
+        refreshed[0] += 1
+        async with semaphore:
+            async with politeness_lock:
+                delay = last_request[0] + PREFETCH_REQUEST_DELAY - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                last_request[0] = time.monotonic()
+            await loader(name, filename)
+    
+    entities = [
+        ('group', group) for group in groups if group.get('name') and group.get('filename')
+    ] + [
+        ('teacher', teacher) for teacher in teachers if teacher.get('name') and teacher.get('filename')
+    ]
+    popularity = {(kind, entity['name']): get_popularity(kind, entity['name'], now) for kind, entity in entities}
+    entities.sort(key=lambda item: popularity[(item[0], item[1]['name'])], reverse=True)
+    hot = select_hot_entities(
+        [(popularity[(kind, entity['name'])], kind, entity['name']) for kind, entity in entities],
+        is_rush_hour(datetime.now())
+    )
+    
+    jobs = [
+        refresh(load_group_schedule if kind == 'group' else load_teacher_schedule, f"{kind}s",
+                f"{kind}_{entity['name']}", entity['name'], entity['filename'],
+                PREFETCH_HOT_INTERVAL if (kind, entity['name']) in hot else PREFETCH_INTERVAL)
+        for kind, entity in entities
+    ]
+    
+    started = time.monotonic()
+    await asyncio.gather(*jobs, return_exceptions=True)
+    if refreshed[0]:
+        logger.info(f"Прогрев кэша завершён: {refreshed[0]} из {len(jobs)} расписаний за {time.monotonic() - started:.0f} с")
+
+
+async def prefetch_loop():
+    """Фоновый планировщик прогрева кэша расписаний"""
+    while True:
+        try:
+            await prefetch_all_schedules()
+        except Exception as e:
+            logger.error(f"Ошибка при прогреве кэша расписаний: {e}")
+        
+        await asyncio.sleep(PREFETCH_HOT_INTERVAL)
+
+
+@dp.update.outer_middleware()
+async def track_user_activity(handler, event: types.Update, data: Dict[str, Any]):
+    """Отмечает активность зарегистрированных пользователей"""
+    user = data.get('event_from_user')
+    if user:
+        touch_user(str(user.id))
+    return await handler(event, data)
+
+
 @dp.message(CommandStart())
-async def cmd_start(message: Message):
-    user_id = str(message.from_user.id)
-    users = load_users()
+async def cmd_start(message: Message, command: CommandObject):
+    register_user(str(message.from_user.id))
     
-    if user_id not in users:
-        users.append(user_id)
-        save_users(users)
+    deep_link = parse_schedule_deep_link(command.args)
+    if deep_link:
+        await send_schedule_message(message, *deep_link)
+        return
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [
@@ -987,7 +2717,7 @@ async def show_groups(callback: types.CallbackQuery):
         return
     
     page = 0
-    keyboard = create_groups_keyboard(groups, page, user_id=str(callback.from_user.id))
+    keyboard = create_groups_keyboard(groups, page)
     
     await callback.message.edit_text(
         f"👥 <b>ВЫБЕРИТЕ ГРУППУ</b>\n\n"
@@ -1006,55 +2736,99 @@ async def groups_page_navigation(callback: types.CallbackQuery):
     groups = groups_cache.get("groups", [])
     last_update = groups_cache.get("last_update", "никогда")
     
-    keyboard = create_groups_keyboard(groups, page, user_id=str(callback.from_user.id))
+    keyboard = create_groups_keyboard(groups, page)
+    
+    await callback.message.edit_text(
+        f"👥 <b>ВЫБЕРИТЕ ГРУППУ</b>\n\n"
+        f"📊 Всего групп: <b>{len(groups)}</b>\n"
+        f"🔄 Обновлено: <i>{last_update}</i>",
+        parse_mode="HTML",
+        reply_markup=keyboard
+    )
+
+
+def create_schedule_keyboard(kind: str, name: str, is_favorite: bool, view: str = 'week',
+                             page: int = 0, total_pages: int = 1) -> InlineKeyboardMarkup:
+    """Клавиатура под расписанием: избранное, переключение дней, обновление и навигация"""
+    view_action = f"{kind}_view"
+    
+    def view_button(text: str, target: str) -> InlineKeyboardButton:
+        marker = "• " if target == view else ""
+        return InlineKeyboardButton(text=f"{marker}{text}", callback_data=entity_callback(view_action, name, target))
+    
+    favorite_emoji = "⭐" if is_favorite else "☆"
+    favorite_text = "Удалить из избранного" if is_favorite else "Добавить в избранное"
+    favorite_action = f"remove_favorite_{kind}" if is_favorite else f"add_favorite_{kind}"
+    
+    if kind == 'group':
+        back_button = InlineKeyboardButton(text="👥 К списку групп", callback_data="groups")
+    else:
+        back_button = InlineKeyboardButton(text="👨‍🏫 К списку преподавателей", callback_data="teachers")
+    
+    page_buttons = []
+    if page > 0:
+        page_buttons.append(InlineKeyboardButton(text="◀️", callback_data=entity_callback(view_action, name, view, page - 1)))
+    if total_pages > 1:
+        page_buttons.append(InlineKeyboardButton(text=f"{page + 1}/{total_pages}", callback_data="noop"))
+    if page < total_pages - 1:
+        page_buttons.append(InlineKeyboardButton(text="▶️", callback_data=entity_callback(view_action, name, view, page + 1)))
+    
+    return InlineKeyboardMarkup(inline_keyboard=[row for row in [
+        page_buttons,
+        [InlineKeyboardButton(text=f"{favorite_emoji} {favorite_text}", callback_data=entity_callback(favorite_action, name))],
+        [view_button("Сегодня", 'today'), view_button("Завтра", 'tomorrow'), view_button("⏱ Сейчас", 'now'),
+         view_button("Неделя", 'week')],
+        [view_button(WEEKDAYS_SHORT[i], f"d{i}") for i in range(6)],
+        [InlineKeyboardButton(text="🔄 Обновить", callback_data=entity_callback(f"refresh_{kind}", name))],
+        [back_button, InlineKeyboardButton(text="🏠 В главное", callback_data="back_to_main")]
+    ] if row])
+
+
+async def edit_schedule_message(callback: types.CallbackQuery, text: str, keyboard: InlineKeyboardMarkup):
+    """Редактирует сообщение с расписанием на месте; повторное нажатие того же дня не считается ошибкой"""
+    try:
+        await callback.message.edit_text(text, parse_mode="HTML", reply_markup=keyboard)
+    except TelegramBadRequest as e:
+        if "message is not modified" not in str(e):
+            raise
+    await callback.answer()
+
+
+async def send_schedule_message(message: Message, kind: str, name: str):
+    """Отправляет расписание новым сообщением, например по ссылке из inline-режима"""
+    pages = render_schedule_pages(kind, name)
+    if not pages:
+        await message.answer(f"📅 <b>{html_escape(name)}</b>", parse_mode="HTML", reply_markup=InlineKeyboardMarkup(
+            inline_keyboard=[[InlineKeyboardButton(text="📅 Открыть расписание", callback_data=entity_callback(kind, name))]]
+        ))
+        return
     
-    await callback.message.edit_text(
-        f"👥 <b>ВЫБЕРИТЕ ГРУППУ</b>\n\n"
-        f"📊 Всего групп: <b>{len(groups)}</b>\n"
-        f"🔄 Обновлено: <i>{last_update}</i>",
-        parse_mode="HTML",
-        reply_markup=keyboard
-    )
+    record_schedule_access(kind, name, str(message.from_user.id))
+    is_favorite = name in get_user_favorites(str(message.from_user.id), f"{kind}s")
+    await message.answer(pages[0], parse_mode="HTML",
+                         reply_markup=create_schedule_keyboard(kind, name, is_favorite, 'week', 0, len(pages)))
 
 
-@dp.callback_query(F.data.startswith("group:"))
+@dp.callback_query(entity_callback_filter('group') | entity_callback_filter('group_view'))
 async def show_group_schedule(callback: types.CallbackQuery):
-    group_name = callback.data.split(":", 1)[1]
-    
-    await callback.message.edit_text(f"⏳ <b>Загружаем расписание для группы {group_name}...</b>", parse_mode="HTML")
+    group_name = parse_entity_callback(callback.data)
+    if group_name is None:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
+    view = parse_entity_view(callback.data)
+    page = parse_entity_page(callback.data)
+    record_schedule_access('group', group_name, str(callback.from_user.id))
     
     cache = load_cache()
     cache_key = f"group_{group_name}"
     
-    if cache_key in cache["groups"]:
-        schedule_text = cache["groups"][cache_key]
-        
-        favorites = load_favorites()
-        user_id = str(callback.from_user.id)
-        is_favorite = user_id in favorites and group_name in favorites[user_id].get('groups', [])
-        
-        favorite_emoji = "⭐" if is_favorite else "☆"
-        favorite_text = "Удалить из избранного" if is_favorite else "Добавить в избранное"
-        favorite_callback = f"remove_favorite_group:{group_name}" if is_favorite else f"add_favorite_group:{group_name}"
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=f"{favorite_emoji} {favorite_text}", callback_data=favorite_callback)],
-            [InlineKeyboardButton(text="🔄 Обновить", callback_data=f"refresh_group:{group_name}")],
-            [
-                InlineKeyboardButton(text="👥 К списку групп", callback_data="groups"),
-                InlineKeyboardButton(text="🏠 В главное", callback_data="back_to_main")
-            ]
-        ])
-        
-        await callback.message.edit_text(schedule_text, parse_mode="HTML", reply_markup=keyboard)
+    entry = get_cache_entry(cache["groups"], cache_key)
+    
+    if entry:
+        if not is_cache_entry_fresh(entry):
+            run_in_background(load_group_schedule(group_name, entry["filename"]))
     else:
-        groups_cache = load_groups_cache()
-        group_data = None
-        
-        for group in groups_cache.get("groups", []):
-            if group.get('name') == group_name:
-                group_data = group
-                break
+        group_data = find_group(group_name)
         
         if not group_data:
             await callback.message.edit_text(
@@ -1070,7 +2844,7 @@ async def show_group_schedule(callback: types.CallbackQuery):
         
         await callback.message.edit_text(f"⏳ <b>Парсим расписание для группы {group_name}...</b>", parse_mode="HTML")
         
-        schedule_data = await fetch_group_schedule(group_name, group_data.get('filename'))
+        schedule_data = await load_group_schedule(group_name, group_data.get('filename'))
         
         if 'error' in schedule_data:
             await callback.message.edit_text(
@@ -1078,35 +2852,18 @@ async def show_group_schedule(callback: types.CallbackQuery):
                 f"Попробуйте позже или обратитесь к администратору.",
                 parse_mode="HTML",
                 reply_markup=InlineKeyboardMarkup(inline_keyboard=[
-                    [InlineKeyboardButton(text="🔄 Попробовать снова", callback_data=f"group:{group_name}")],
+                    [InlineKeyboardButton(text="🔄 Попробовать снова", callback_data=entity_callback('group', group_name))],
                     [InlineKeyboardButton(text="👥 К списку групп", callback_data="groups")]
                 ])
             )
             return
-        
-        schedule_text = format_group_schedule(schedule_data)
-        
-        cache["groups"][cache_key] = schedule_text
-        cache["last_update"] = datetime.now().strftime("%d.%m.%Y %H:%M")
-        save_cache(cache)
-        
-        favorites = load_favorites()
-        user_id = str(callback.from_user.id)
-        is_favorite = user_id in favorites and group_name in favorites[user_id].get('groups', [])
-        
-        favorite_emoji = "⭐" if is_favorite else "☆"
-        favorite_text = "Удалить из избранного" if is_favorite else "Добавить в избранное"
-        favorite_callback = f"remove_favorite_group:{group_name}" if is_favorite else f"add_favorite_group:{group_name}"
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=f"{favorite_emoji} {favorite_text}", callback_data=favorite_callback)],
-            [
-                InlineKeyboardButton(text="👥 К списку групп", callback_data="groups"),
-                InlineKeyboardButton(text="🏠 В главное", callback_data="back_to_main")
-            ]
-        ])
-        
-        await callback.message.edit_text(schedule_text, parse_mode="HTML", reply_markup=keyboard)
+    
+    pages = render_schedule_pages('group', group_name, view) or split_message(format_group_schedule(schedule_data))
+    page = min(page, len(pages) - 1)
+    is_favorite = group_name in get_user_favorites(str(callback.from_user.id), 'groups')
+    
+    await edit_schedule_message(callback, pages[page],
+                                create_schedule_keyboard('group', group_name, is_favorite, view, page, len(pages)))
 
 
 @dp.callback_query(F.data == "teachers")
@@ -1134,7 +2891,7 @@ async def show_teachers(callback: types.CallbackQuery):
         return
     
     page = 0
-    keyboard = create_teachers_keyboard(teachers, page, user_id=str(callback.from_user.id))
+    keyboard = create_teachers_keyboard(teachers, page)
     
     await callback.message.edit_text(
         f"👨‍🏫 <b>ВЫБЕРИТЕ ПРЕПОДАВАТЕЛЯ</b>\n\n"
@@ -1153,7 +2910,7 @@ async def teachers_page_navigation(callback: types.CallbackQuery):
     teachers = teachers_cache.get("teachers", [])
     last_update = teachers_cache.get("last_update", "никогда")
     
-    keyboard = create_teachers_keyboard(teachers, page, user_id=str(callback.from_user.id))
+    keyboard = create_teachers_keyboard(teachers, page)
     
     await callback.message.edit_text(
         f"👨‍🏫 <b>ВЫБЕРИТЕ ПРЕПОДАВАТЕЛЯ</b>\n\n"
@@ -1164,44 +2921,26 @@ async def teachers_page_navigation(callback: types.CallbackQuery):
     )
 
 
-@dp.callback_query(F.data.startswith("teacher:"))
+@dp.callback_query(entity_callback_filter('teacher') | entity_callback_filter('teacher_view'))
 async def show_teacher_schedule(callback: types.CallbackQuery):
-    teacher_name = callback.data.split(":", 1)[1]
-    
-    await callback.message.edit_text(f"⏳ <b>Загружаем расписание для {teacher_name}...</b>", parse_mode="HTML")
+    teacher_name = parse_entity_callback(callback.data)
+    if teacher_name is None:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
+    view = parse_entity_view(callback.data)
+    page = parse_entity_page(callback.data)
+    record_schedule_access('teacher', teacher_name, str(callback.from_user.id))
     
     cache = load_cache()
     cache_key = f"teacher_{teacher_name}"
     
-    if cache_key in cache["teachers"]:
-        schedule_text = cache["teachers"][cache_key]
-        
-        favorites = load_favorites()
-        user_id = str(callback.from_user.id)
-        is_favorite = user_id in favorites and teacher_name in favorites[user_id].get('teachers', [])
-        
-        favorite_emoji = "⭐" if is_favorite else "☆"
-        favorite_text = "Удалить из избранного" if is_favorite else "Добавить в избранное"
-        favorite_callback = f"remove_favorite_teacher:{teacher_name}" if is_favorite else f"add_favorite_teacher:{teacher_name}"
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=f"{favorite_emoji} {favorite_text}", callback_data=favorite_callback)],
-            [InlineKeyboardButton(text="🔄 Обновить", callback_data=f"refresh_teacher:{teacher_name}")],
-            [
-                InlineKeyboardButton(text="👨‍🏫 К списку преподавателей", callback_data="teachers"),
-                InlineKeyboardButton(text="🏠 В главное", callback_data="back_to_main")
-            ]
-        ])
-        
-        await callback.message.edit_text(schedule_text, parse_mode="HTML", reply_markup=keyboard)
+    entry = get_cache_entry(cache["teachers"], cache_key)
+    
+    if entry:
+        if not is_cache_entry_fresh(entry):
+            run_in_background(load_teacher_schedule(teacher_name, entry["filename"]))
     else:
-        teachers_cache = load_teachers_cache()
-        teacher_data = None
-        
-        for teacher in teachers_cache.get("teachers", []):
-            if teacher.get('name') == teacher_name:
-                teacher_data = teacher
-                break
+        teacher_data = find_teacher(teacher_name)
         
         if not teacher_data:
             await callback.message.edit_text(
@@ -1214,86 +2953,62 @@ async def show_teacher_schedule(callback: types.CallbackQuery):
             )
             return
         
-        schedule_data = await fetch_teacher_schedule(teacher_name, teacher_data.get('filename'))
-        schedule_text = format_teacher_schedule(schedule_data)
-        
-        cache["teachers"][cache_key] = schedule_text
-        cache["last_update"] = datetime.now().strftime("%d.%m.%Y %H:%M")
-        save_cache(cache)
-        
-        favorites = load_favorites()
-        user_id = str(callback.from_user.id)
-        is_favorite = user_id in favorites and teacher_name in favorites[user_id].get('teachers', [])
+        await callback.message.edit_text(f"⏳ <b>Загружаем расписание для {teacher_name}...</b>", parse_mode="HTML")
         
-        favorite_emoji = "⭐" if is_favorite else "☆"
-        favorite_text = "Удалить из избранного" if is_favorite else "Добавить в избранное"
-        favorite_callback = f"remove_favorite_teacher:{teacher_name}" if is_favorite else f"add_favorite_teacher:{teacher_name}"
-        
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=f"{favorite_emoji} {favorite_text}", callback_data=favorite_callback)],
-            [
-                InlineKeyboardButton(text="👨‍🏫 К списку преподавателей", callback_data="teachers"),
-                InlineKeyboardButton(text="🏠 В главное", callback_data="back_to_main")
-            ]
-        ])
-        
-        await callback.message.edit_text(schedule_text, parse_mode="HTML", reply_markup=keyboard)
+        schedule_data = await load_teacher_schedule(teacher_name, teacher_data.get('filename'))
+    
+    pages = render_schedule_pages('teacher', teacher_name, view) or split_message(format_teacher_schedule(schedule_data))
+    page = min(page, len(pages) - 1)
+    is_favorite = teacher_name in get_user_favorites(str(callback.from_user.id), 'teachers')
+    
+    await edit_schedule_message(callback, pages[page],
+                                create_schedule_keyboard('teacher', teacher_name, is_favorite, view, page, len(pages)))
 
 
-@dp.callback_query(F.data.startswith("add_favorite_group:"))
+@dp.callback_query(entity_callback_filter('add_favorite_group'))
 async def add_favorite_group(callback: types.CallbackQuery):
-    group_name = callback.data.split(":")[1]
-    user_id = str(callback.from_user.id)
-    
-    favorites = load_favorites()
-    if user_id not in favorites:
-        favorites[user_id] = {"groups": [], "teachers": []}
+    group_name = parse_entity_callback(callback.data)
+    if group_name is None:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
     
-    if group_name not in favorites[user_id]["groups"]:
-        favorites[user_id]["groups"].append(group_name)
-        save_favorites(favorites)
+    add_favorite(str(callback.from_user.id), 'groups', group_name)
     
     await show_group_schedule(callback)
 
 
-@dp.callback_query(F.data.startswith("remove_favorite_group:"))
+@dp.callback_query(entity_callback_filter('remove_favorite_group'))
 async def remove_favorite_group(callback: types.CallbackQuery):
-    group_name = callback.data.split(":")[1]
-    user_id = str(callback.from_user.id)
+    group_name = parse_entity_callback(callback.data)
+    if group_name is None:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
     
-    favorites = load_favorites()
-    if user_id in favorites and group_name in favorites[user_id]["groups"]:
-        favorites[user_id]["groups"].remove(group_name)
-        save_favorites(favorites)
+    remove_favorite(str(callback.from_user.id), 'groups', group_name)
     
     await show_group_schedule(callback)
 
 
-@dp.callback_query(F.data.startswith("add_favorite_teacher:"))
+@dp.callback_query(entity_callback_filter('add_favorite_teacher'))
 async def add_favorite_teacher(callback: types.CallbackQuery):
-    teacher_name = callback.data.split(":")[1]
-    user_id = str(callback.from_user.id)
-    
-    favorites = load_favorites()
-    if user_id not in favorites:
-        favorites[user_id] = {"groups": [], "teachers": []}
+    teacher_name = parse_entity_callback(callback.data)
+    if teacher_name is None:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
     
-    if teacher_name not in favorites[user_id]["teachers"]:
-        favorites[user_id]["teachers"].append(teacher_name)
-        save_favorites(favorites)
+    add_favorite(str(callback.from_user.id), 'teachers', teacher_name)
     
     await show_teacher_schedule(callback)
 
 
-@dp.callback_query(F.data.startswith("remove_favorite_teacher:"))
+@dp.callback_query(entity_callback_filter('remove_favorite_teacher'))
 async def remove_favorite_teacher(callback: types.CallbackQuery):
-    teacher_name = callback.data.split(":")[1]
-    user_id = str(callback.from_user.id)
+    teacher_name = parse_entity_callback(callback.data)
+    if teacher_name is None:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
     
-    favorites = load_favorites()
-    if user_id in favorites and teacher_name in favorites[user_id]["teachers"]:
-        favorites[user_id]["teachers"].remove(teacher_name)
-        save_favorites(favorites)
+    remove_favorite(str(callback.from_user.id), 'teachers', teacher_name)
     
     await show_teacher_schedule(callback)
 
@@ -1301,11 +3016,9 @@ async def remove_favorite_teacher(callback: types.CallbackQuery):
 @dp.callback_query(F.data == "favorites_menu")
 async def show_favorites_menu(callback: types.CallbackQuery):
     user_id = str(callback.from_user.id)
-    favorites = load_favorites()
     
-    user_favorites = favorites.get(user_id, {"groups": [], "teachers": []})
-    groups_count = len(user_favorites.get("groups", []))
-    teachers_count = len(user_favorites.get("teachers", []))
+    groups_count = len(get_user_favorites(user_id, "groups"))
+    teachers_count = len(get_user_favorites(user_id, "teachers"))
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text=f"⭐ Группы ({groups_count})", callback_data="favorite_groups")],
@@ -1326,9 +3039,7 @@ async def show_favorites_menu(callback: types.CallbackQuery):
 @dp.callback_query(F.data == "favorite_groups")
 async def show_favorite_groups(callback: types.CallbackQuery):
     user_id = str(callback.from_user.id)
-    favorites = load_favorites()
-    
-    favorite_groups_names = favorites.get(user_id, {}).get("groups", [])
+    favorite_groups_names = get_user_favorites(user_id, "groups")
     
     if not favorite_groups_names:
         await callback.message.edit_text(
@@ -1343,16 +3054,10 @@ async def show_favorite_groups(callback: types.CallbackQuery):
         )
         return
     
-    groups_cache = load_groups_cache()
-    all_groups = groups_cache.get("groups", [])
-    favorite_groups = []
-    
-    for group in all_groups:
-        if group.get('name') in favorite_groups_names:
-            favorite_groups.append(group)
+    favorite_groups = get_list_index('groups').select(favorite_groups_names)
     
     page = 0
-    keyboard = create_groups_keyboard(favorite_groups, page, show_favorites=True, user_id=user_id)
+    keyboard = create_groups_keyboard(favorite_groups, page, show_favorites=True, favorites=favorite_groups_names)
     
     await callback.message.edit_text(
         f"⭐ <b>ИЗБРАННЫЕ ГРУППЫ</b>\n\n"
@@ -1365,9 +3070,7 @@ async def show_favorite_groups(callback: types.CallbackQuery):
 @dp.callback_query(F.data == "favorite_teachers")
 async def show_favorite_teachers(callback: types.CallbackQuery):
     user_id = str(callback.from_user.id)
-    favorites = load_favorites()
-    
-    favorite_teachers_names = favorites.get(user_id, {}).get("teachers", [])
+    favorite_teachers_names = get_user_favorites(user_id, "teachers")
     
     if not favorite_teachers_names:
         await callback.message.edit_text(
@@ -1382,16 +3085,10 @@ async def show_favorite_teachers(callback: types.CallbackQuery):
         )
         return
     
-    teachers_cache = load_teachers_cache()
-    all_teachers = teachers_cache.get("teachers", [])
-    favorite_teachers = []
-    
-    for teacher in all_teachers:
-        if teacher.get('name') in favorite_teachers_names:
-            favorite_teachers.append(teacher)
+    favorite_teachers = get_list_index('teachers').select(favorite_teachers_names)
     
     page = 0
-    keyboard = create_teachers_keyboard(favorite_teachers, page, show_favorites=True, user_id=user_id)
+    keyboard = create_teachers_keyboard(favorite_teachers, page, show_favorites=True, favorites=favorite_teachers_names)
     
     await callback.message.edit_text(
         f"⭐ <b>ИЗБРАННЫЕ ПРЕПОДАВАТЕЛИ</b>\n\n"
@@ -1411,28 +3108,44 @@ async def refresh_teachers_list(callback: types.CallbackQuery):
     await show_teachers(callback)
 
 
-@dp.callback_query(F.data.startswith("refresh_group:"))
+@dp.callback_query(entity_callback_filter('refresh_group'))
 async def refresh_group_schedule(callback: types.CallbackQuery):
-    group_name = callback.data.split(":", 1)[1]
+    group_name = parse_entity_callback(callback.data)
+    if group_name is None:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
     
     cache = load_cache()
     cache_key = f"group_{group_name}"
-    if cache_key in cache["groups"]:
+    entry = get_cache_entry(cache["groups"], cache_key)
+    if entry:
+        await callback.message.edit_text(f"⏳ <b>Обновляем расписание {group_name}...</b>", parse_mode="HTML")
+        group_data = find_group(group_name)
+        await load_group_schedule(group_name, group_data["filename"] if group_data else entry["filename"])
+    elif cache_key in cache["groups"]:
         del cache["groups"][cache_key]
-        save_cache(cache)
+        save_cache(cache, changed=[("groups", cache_key)])
     
     await show_group_schedule(callback)
 
 
-@dp.callback_query(F.data.startswith("refresh_teacher:"))
+@dp.callback_query(entity_callback_filter('refresh_teacher'))
 async def refresh_teacher_schedule(callback: types.CallbackQuery):
-    teacher_name = callback.data.split(":", 1)[1]
+    teacher_name = parse_entity_callback(callback.data)
+    if teacher_name is None:
+        await callback.answer(STALE_BUTTON_TEXT, show_alert=True)
+        return
     
     cache = load_cache()
     cache_key = f"teacher_{teacher_name}"
-    if cache_key in cache["teachers"]:
+    entry = get_cache_entry(cache["teachers"], cache_key)
+    if entry:
+        await callback.message.edit_text(f"⏳ <b>Обновляем расписание {teacher_name}...</b>", parse_mode="HTML")
+        teacher_data = find_teacher(teacher_name)
+        await load_teacher_schedule(teacher_name, teacher_data["filename"] if teacher_data else entry["filename"])
+    elif cache_key in cache["teachers"]:
         del cache["teachers"][cache_key]
-        save_cache(cache)
+        save_cache(cache, changed=[("teachers", cache_key)])
     
     await show_teacher_schedule(callback)
 
@@ -1517,13 +3230,143 @@ async def about_bot(callback: types.CallbackQuery):
     await callback.message.edit_text(about_text, parse_mode="HTML", reply_markup=keyboard)
 
 
+def create_search_results_keyboard(group_names: List[str], teacher_names: List[str]) -> InlineKeyboardMarkup:
+    """Клавиатура с результатами поиска: по одной кнопке на строку"""
+    keyboard_buttons = [
+        [InlineKeyboardButton(text=f"👥 {name}", callback_data=entity_callback('group', name))] for name in group_names
+    ] + [
+        [InlineKeyboardButton(text=f"👨‍🏫 {name}", callback_data=entity_callback('teacher', name))] for name in teacher_names
+    ]
+    keyboard_buttons.append([InlineKeyboardButton(text="🏠 В главное меню", callback_data="back_to_main")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
+
+
+async def answer_search(message: Message, query: str, kinds: tuple):
+    """Ищет по индексам и отвечает списком найденных групп и преподавателей"""
+    group_names = get_search_index('groups').search(query) if 'groups' in kinds else []
+    teacher_names = get_search_index('teachers').search(query) if 'teachers' in kinds else []
+    
+    if not group_names and not teacher_names:
+        await message.answer(
+            f"🔍 По запросу «{html_escape(query)}» ничего не найдено.\nПопробуйте написать иначе.",
+            parse_mode="HTML",
+            reply_markup=create_search_results_keyboard([], [])
+        )
+        return
+    
+    await message.answer(
+        f"🔍 Результаты поиска по запросу «{html_escape(query)}»:",
+        parse_mode="HTML",
+        reply_markup=create_search_results_keyboard(group_names, teacher_names)
+    )
+
+
 @dp.callback_query(F.data == "search_groups")
-async def search_groups(callback: types.CallbackQuery):
-    await callback.answer("Поиск групп пока не реализован", show_alert=True)
+async def search_groups(callback: types.CallbackQuery, state: FSMContext):
+    await state.set_state(SearchStates.waiting_for_group_query)
+    await callback.message.answer("🔍 Введите название группы (можно часть, например «ис-2»):")
+    await callback.answer()
 
 @dp.callback_query(F.data == "search_teachers")
-async def search_teachers(callback: types.CallbackQuery):
-    await callback.answer("Поиск преподавателей пока не реализован", show_alert=True)
+async def search_teachers(callback: types.CallbackQuery, state: FSMContext):
+    await state.set_state(SearchStates.waiting_for_teacher_query)
+    await callback.message.answer("🔍 Введите фамилию преподавателя (можно часть):")
+    await callback.answer()
+
+
+@dp.message(SearchStates.waiting_for_group_query, F.text)
+async def process_group_search(message: Message, state: FSMContext):
+    await state.clear()
+    await answer_search(message, message.text, ('groups',))
+
+
+@dp.message(SearchStates.waiting_for_teacher_query, F.text)
+async def process_teacher_search(message: Message, state: FSMContext):
+    await state.clear()
+    await answer_search(message, message.text, ('teachers',))
+
+
+@dp.message(StateFilter(None), F.chat.type == "private", F.text, ~F.text.startswith("/"))
+async def process_free_text_search(message: Message):
+    await answer_search(message, message.text, ('groups', 'teachers'))
+
+
+INLINE_CACHE_TIME = 300
+INLINE_PENDING_CACHE_TIME = 5
+INLINE_LOAD_TIMEOUT = 3
+INLINE_DEBOUNCE = 0.8
+
+
+_inline_latest_query: Dict[str, str] = {}
+
+
+def _inline_candidates(query: str, user_id: str) -> List[tuple]:
+    """Подбирает (вид, название) для inline-запроса; пустой запрос — избранное пользователя"""
+    if not query.strip():
+        return ([('group', name) for name in sorted(get_user_favorites(user_id, 'groups'))]
+                + [('teacher', name) for name in sorted(get_user_favorites(user_id, 'teachers'))])
+    
+    return ([('group', name) for name in get_search_index('groups').search(query)]
+            + [('teacher', name) for name in get_search_index('teachers').search(query)])[:SEARCH_RESULTS_LIMIT]
+
+
+async def load_inline_top_match(user_id: str, query_id: str, kind: str, name: str):
+    """Загружает лучшее совпадение inline-запроса, если пользователь перестал печатать; остальное греет prefetch"""
+    _inline_latest_query[user_id] = query_id
+    await asyncio.sleep(INLINE_DEBOUNCE)
+    if _inline_latest_query.get(user_id) != query_id:
+        return
+    del _inline_latest_query[user_id]
+    
+    entity = find_group(name) if kind == 'group' else find_teacher(name)
+    if not entity or not entity.get('filename'):
+        return
+    
+    loader = load_group_schedule if kind == 'group' else load_teacher_schedule
+    await asyncio.wait([run_in_background(loader(name, entity['filename']))], timeout=INLINE_LOAD_TIMEOUT)
+
+
+@dp.inline_query()
+async def inline_schedule_lookup(inline_query: InlineQuery):
+    user_id = str(inline_query.from_user.id)
+    candidates = _inline_candidates(inline_query.query, user_id)
+    
+    if candidates:
+        kind, name = candidates[0]
+        if not get_cache_entry(load_cache()[f"{kind}s"], f"{kind}_{name}"):
+            await load_inline_top_match(user_id, inline_query.id, kind, name)
+    
+    results = []
+    pending = False
+    for kind, name in candidates:
+        pages = render_schedule_pages(kind, name)
+        if pages is None:
+            pending = True
+            continue
+        
+        schedule_text = pages[0]
+        keyboard = None
+        if len(pages) > 1:
+            schedule_text += f"\n\n<i>… продолжение ещё на {len(pages) - 1} стр. — в боте</i>"
+            bot_username = (await bot.me()).username
+            keyboard = InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
+                text="📅 Всё расписание",
+                url=f"https://t.me/{bot_username}?start={schedule_deep_link_payload(kind, name)}"
+            )]])
+        
+        results.append(InlineQueryResultArticle(
+            id=hashlib.md5(f"{kind}:{name}".encode('utf-8')).hexdigest(),
+            title=f"{'👥' if kind == 'group' else '👨‍🏫'} {name}",
+            description="Расписание на неделю",
+            input_message_content=InputTextMessageContent(message_text=schedule_text, parse_mode="HTML"),
+            reply_markup=keyboard
+        ))
+    
+    await inline_query.answer(
+        results,
+        cache_time=INLINE_PENDING_CACHE_TIME if pending else INLINE_CACHE_TIME,
+        is_personal=not inline_query.query.strip()
+    )
 
 
 @dp.callback_query(F.data == "noop")
@@ -1541,18 +3384,48 @@ async def cmd_admin(message: Message):
         return
     
     users_count = len(load_users())
+    churn = get_user_churn_stats()
     
     keyboard = InlineKeyboardMarkup(inline_keyboard=[
         [InlineKeyboardButton(text="📢 Сделать объявление", callback_data="make_announcement")],
         [InlineKeyboardButton(text=f"👥 Пользователи ({users_count})", callback_data="user_stats")],
         [InlineKeyboardButton(text="🔄 Обновить все списки", callback_data="force_update_lists")],
+        [InlineKeyboardButton(text="📋 Рассылки", callback_data="broadcasts_list")],
         [InlineKeyboardButton(text="🏠 В главное меню", callback_data="back_to_main")]
     ])
     
-    await message.answer(f"👑 <b>Панель администратора</b>\n\nПользователей: {users_count}", 
+    await message.answer(f"👑 <b>Панель администратора</b>\n\nПользователей: {users_count}\n"
+                         f"Активных: {churn['active']}, неактивных: {churn['inactive']}\n"
+                         f"За {CHURN_WINDOW_DAYS} дн.: +{churn['joined']} / −{churn['left']}", 
                         parse_mode="HTML", reply_markup=keyboard)
 
 
+@dp.callback_query(F.data == "user_stats")
+async def show_user_stats(callback: types.CallbackQuery):
+    if str(callback.from_user.id) not in load_admins():
+        await callback.answer("⛔ У вас нет прав администратора!", show_alert=True)
+        return
+    
+    churn = get_user_churn_stats()
+    text = (
+        f"👥 <b>ПОЛЬЗОВАТЕЛИ</b>\n\n"
+        f"Всего: {churn['active'] + churn['inactive']}\n"
+        f"✅ Активных: {churn['active']}\n"
+        f"🚫 Неактивных: {churn['inactive']}\n"
+    )
+    for reason, count in churn["reasons"].items():
+        text += f"   • {INACTIVE_REASONS.get(reason, reason)}: {count}\n"
+    text += (
+        f"\n📈 Новых за {CHURN_WINDOW_DAYS} дн.: {churn['joined']}\n"
+        f"📉 Ушедших за {CHURN_WINDOW_DAYS} дн.: {churn['left']}"
+    )
+    
+    await callback.message.edit_text(text, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="🏠 В главное меню", callback_data="back_to_main")]
+    ]))
+    await callback.answer()
+
+
 @dp.message(Command("addadmin"))
 async def cmd_addadmin(message: Message, state: FSMContext):
     user_id = str(message.from_user.id)
@@ -1690,6 +3563,283 @@ async def process_announcement_photo(message: Message, state: FSMContext):
         )
 
 
+BROADCAST_RATE = 25
+BROADCAST_WORKERS = 10
+BROADCAST_MAX_RETRIES = 3
+BROADCAST_PROGRESS_INTERVAL = 3
+
+
+class TokenBucket:
+    """Ограничитель скорости «ведро токенов» с возможностью паузы по RetryAfter"""
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+    
+    def block(self, seconds: float):
+        """Приостанавливает выдачу токенов (Telegram попросил подождать)"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0
+    
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.blocked_until:
+                    await asyncio.sleep(self.blocked_until - now)
+                    self.updated_at = time.monotonic()
+                    continue
+                
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+broadcast_limiter = TokenBucket(BROADCAST_RATE)
+
+
+async def send_announcement(user_id: str, announcement_text: str, photo_id: Optional[str]):
+    """Отправляет объявление одному пользователю"""
+    if photo_id:
+        await bot.send_photo(
+            user_id,
+            photo_id,
+            caption=f"📢 <b>ОБЪЯВЛЕНИЕ</b>\n\n{announcement_text}" if announcement_text else "📢 <b>ОБЪЯВЛЕНИЕ</b>",
+            parse_mode="HTML"
+        )
+    else:
+        await bot.send_message(
+            user_id, 
+            f"📢 <b>ОБЪЯВЛЕНИЕ</b>\n\n{announcement_text}", 
+            parse_mode="HTML"
+        )
+
+
+def classify_delivery_error(error: Exception) -> Optional[str]:
+    """Определяет, означает ли ошибка отправки, что чат больше недоступен навсегда"""
+    message = str(error).lower()
+    
+    if isinstance(error, TelegramForbiddenError):
+        if "deactivated" in message:
+            return 'deactivated'
+        return 'blocked'
+    if isinstance(error, TelegramBadRequest) and "chat not found" in message:
+        return 'not_found'
+    return None
+
+
+async def deliver_announcement(user_id: str, announcement_text: str, photo_id: Optional[str]) -> str:
+    """Доставляет объявление с учётом лимитов Telegram; возвращает 'sent', 'failed' или причину из INACTIVE_REASONS"""
+    return await deliver_message(user_id, lambda: send_announcement(user_id, announcement_text, photo_id))
+
+
+async def deliver_message(user_id: str, send) -> str:
+    """Отправляет сообщение через общий лимит скорости с повторами при временных сбоях"""
+    for attempt in range(BROADCAST_MAX_RETRIES + 1):
+        await broadcast_limiter.acquire()
+        try:
+            await send()
+            return 'sent'
+        except TelegramRetryAfter as e:
+            logger.warning(f"Flood control при рассылке, пауза {e.retry_after} с")
+            broadcast_limiter.block(e.retry_after)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logger.warning(f"Временная ошибка при отправке пользователю {user_id}: {e}")
+            await asyncio.sleep(2 ** attempt)
+        except Exception as e:
+            reason = classify_delivery_error(e)
+            if reason:
+                return reason
+            logger.error(f"Не удалось отправить сообщение пользователю {user_id}: {e}")
+            return 'failed'
+    
+    logger.error(f"Не удалось отправить сообщение пользователю {user_id}: исчерпаны повторы")
+    return 'failed'
+
+
+async def update_broadcast_progress(chat_id: int, message_id: int, text: str):
+    """Обновляет сообщение администратора с прогрессом рассылки"""
+    try:
+        await broadcast_limiter.acquire()
+        await bot.edit_message_text(text, chat_id=chat_id, message_id=message_id)
+    except TelegramRetryAfter as e:
+        broadcast_limiter.block(e.retry_after)
+    except TelegramBadRequest:
+        pass
+    except Exception as e:
+        logger.warning(f"Не удалось обновить прогресс рассылки: {e}")
+
+
+BROADCAST_HISTORY = 20
+BROADCAST_SHUTDOWN_TIMEOUT = 15
+
+
+_broadcast_tasks: Dict[str, asyncio.Task] = {}
+_broadcasts_stopping = False
+
+
+BROADCAST_STATUSES = {
+    'running': '📤 Идёт',
+    'paused': '⏸ Приостановлена',
+    'cancelled': '✖️ Отменена',
+    'done': '✅ Завершена',
+}
+
+
+def format_broadcast_progress(job: Dict) -> str:
+    """Форматирует прогресс рассылки для администратора"""
+    total = len(job["recipients"])
+    done = job["sent"] + job["failed"]
+    
+    if job["status"] == 'done':
+        result_text = f"✅ Объявление отправлено {job['sent']} пользователям!"
+        if job["failed"] > 0:
+            result_text += f"\n❌ Не удалось отправить {job['failed']} пользователям."
+        if job.get("inactive"):
+            result_text += f"\n🚫 Недоступны и исключены из рассылок: {job['inactive']}"
+        return result_text
+    
+    return (
+        f"{BROADCAST_STATUSES.get(job['status'], job['status'])} рассылка {job['id']}: {done}/{total}\n"
+        f"✅ Доставлено: {job['sent']}\n"
+        f"❌ Ошибок: {job['failed']} (из них недоступных чатов: {job.get('inactive', 0)})"
+    )
+
+
+def create_broadcast_job(announcement_text: str, photo_id: Optional[str], created_by: str,
+                         chat_id: int, message_id: int) -> Dict:
+    """Создаёт и сохраняет задание рассылки со снимком списка получателей"""
+    jobs = load_broadcasts()
+    job_id = uuid.uuid4().hex[:8]
+    
+    jobs[job_id] = {
+        "id": job_id,
+        "status": "running",
+        "text": announcement_text,
+        "photo_id": photo_id,
+        "created_by": created_by,
+        "created_at": time.time(),
+        "chat_id": chat_id,
+        "message_id": message_id,
+        "recipients": get_active_users(),
+        "cursor": 0,
+        "done_ahead": [],
+        "sent": 0,
+        "failed": 0,
+        "inactive": 0
+    }
+    
+    finished = sorted(
+        (job for job in jobs.values() if job["status"] in ('done', 'cancelled')),
+        key=lambda job: job["created_at"]
+    )
+    for old_job in finished[:max(0, len(finished) - BROADCAST_HISTORY)]:
+        del jobs[old_job["id"]]
+        save_broadcasts(jobs, changed=[old_job["id"]])
+    
+    save_broadcasts(jobs, changed=[job_id, ('recipients', job_id)])
+    return jobs[job_id]
+
+
+def _complete_position(job: Dict, position: int):
+    """Отмечает получателя обработанным и сдвигает курсор на непрерывный обработанный префикс"""
+    done_ahead = job["done_ahead"]
+    done_ahead.append(position)
+    while job["cursor"] in done_ahead:
+        done_ahead.remove(job["cursor"])
+        job["cursor"] += 1
+
+
+async def run_broadcast_job(job_id: str):
+    """Фоновая рассылка: пул отправителей, общий лимит скорости, сохранение курсора и живой прогресс"""
+    jobs = load_broadcasts()
+    job = jobs[job_id]
+    recipients = job["recipients"]
+    job.setdefault("inactive", 0)
+    started = time.monotonic()
+    
+    async def worker(pending):
+        for position in pending:
+            result = await deliver_announcement(recipients[position], job["text"], job["photo_id"])
+            if result == 'sent':
+                job["sent"] += 1
+            else:
+                job["failed"] += 1
+            if result in INACTIVE_REASONS:
+                job["inactive"] += 1
+                mark_user_inactive(recipients[position], result)
+            _complete_position(job, position)
+            save_broadcasts(jobs, changed=[job_id])
+            
+            if job["status"] != 'running' or _broadcasts_stopping:
+                break
+    
+    async def report_progress():
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL)
+            await update_broadcast_progress(job["chat_id"], job["message_id"], format_broadcast_progress(job))
+    
+    progress_task = asyncio.create_task(report_progress())
+    try:
+        while job["status"] == 'running' and job["cursor"] < len(recipients) and not _broadcasts_stopping:
+            already_done = set(job["done_ahead"])
+            pending = (position for position in range(job["cursor"], len(recipients))
+                       if position not in already_done)
+            await asyncio.gather(*[worker(pending) for _ in range(min(BROADCAST_WORKERS, len(recipients)))])
+    finally:
+        progress_task.cancel()
+    
+    if _broadcasts_stopping:
+        logger.info(f"Рассылка {job_id} прервана остановкой бота на позиции {job['cursor']}")
+        return
+    
+    if job["status"] == 'running' and job["cursor"] >= len(recipients):
+        job["status"] = 'done'
+        save_broadcasts(jobs, changed=[job_id])
+        logger.info(f"Рассылка {job_id} завершена за {time.monotonic() - started:.0f} с: "
+                    f"{job['sent']} доставлено, {job['failed']} ошибок")
+    
+    await update_broadcast_progress(job["chat_id"], job["message_id"], format_broadcast_progress(job))
+    
+    if job["status"] == 'running' and job["cursor"] < len(recipients) and not _broadcasts_stopping:
+        logger.info(f"Рассылка {job_id} возобновлена до остановки задачи, продолжаем с позиции {job['cursor']}")
+        await run_broadcast_job(job_id)
+
+
+def start_broadcast_job(job_id: str):
+    """Запускает рассылку в фоне, если она ещё не выполняется"""
+    if job_id in _broadcast_tasks:
+        return
+    
+    task = run_in_background(run_broadcast_job(job_id))
+    _broadcast_tasks[job_id] = task
+    task.add_done_callback(lambda _: _broadcast_tasks.pop(job_id, None))
+
+
+def resume_broadcasts():
+    """Продолжает рассылки, прерванные перезапуском бота"""
+    for job_id, job in load_broadcasts().items():
+        if job["status"] == 'running':
+            logger.info(f"Продолжаем рассылку {job_id} с позиции {job['cursor']}/{len(job['recipients'])}")
+            start_broadcast_job(job_id)
+
+
+async def stop_broadcasts():
+    """Останавливает рассылки перед выключением: отправители дожидаются текущих сообщений"""
+    global _broadcasts_stopping
+    
+    _broadcasts_stopping = True
+    if _broadcast_tasks:
+        await asyncio.wait(list(_broadcast_tasks.values()), timeout=BROADCAST_SHUTDOWN_TIMEOUT)
+
+
 @dp.callback_query(AdminStates.announcement_confirmation, F.data == "send_announcement_confirm")
 async def send_announcement_confirm(callback: types.CallbackQuery, state: FSMContext):
     user_data = await state.get_data()
@@ -1702,42 +3852,119 @@ async def send_announcement_confirm(callback: types.CallbackQuery, state: FSMCon
         await state.clear()
         return
     
-    await callback.message.edit_text("📤 Отправка объявления...")
+    await state.clear()
     
-    users = load_users()
-    sent_count = 0
-    failed_count = 0
+    if callback.message.photo:
+        progress_message = await callback.message.answer("📤 Отправка объявления...")
+    else:
+        progress_message = await callback.message.edit_text("📤 Отправка объявления...")
+    
+    job = create_broadcast_job(
+        announcement_text,
+        photo_id if has_photo else None,
+        str(callback.from_user.id),
+        progress_message.chat.id,
+        progress_message.message_id
+    )
+    start_broadcast_job(job["id"])
+    await callback.answer()
+
+
+def create_broadcasts_keyboard() -> InlineKeyboardMarkup:
+    """Клавиатура управления последними рассылками"""
+    jobs = sorted(load_broadcasts().values(), key=lambda job: job["created_at"], reverse=True)
     
-    for user_id in users:
-        try:
-            if has_photo and photo_id:
-
-                await bot.send_photo(
-                    user_id,
-                    photo_id,
-                    caption=f"📢 <b>ОБЪЯВЛЕНИЕ</b>\n\n{announcement_text}" if announcement_text else "📢 <b>ОБЪЯВЛЕНИЕ</b>",
-                    parse_mode="HTML"
-                )
-            else:
+    keyboard_buttons = []
+    for job in jobs[:10]:
+        if job["status"] == 'running':
+            keyboard_buttons.append([
+                InlineKeyboardButton(text=f"⏸ {job['id']}", callback_data=f"broadcast_pause:{job['id']}"),
+                InlineKeyboardButton(text=f"✖️ {job['id']}", callback_data=f"broadcast_cancel:{job['id']}")
+            ])
+        elif job["status"] == 'paused':
+            keyboard_buttons.append([
+                InlineKeyboardButton(text=f"▶️ {job['id']}", callback_data=f"broadcast_resume:{job['id']}"),
+                InlineKeyboardButton(text=f"✖️ {job['id']}", callback_data=f"broadcast_cancel:{job['id']}")
+            ])
+    
+    keyboard_buttons.append([InlineKeyboardButton(text="🔄 Обновить", callback_data="broadcasts_list")])
+    return InlineKeyboardMarkup(inline_keyboard=keyboard_buttons)
 
-                await bot.send_message(
-                    user_id, 
-                    f"📢 <b>ОБЪЯВЛЕНИЕ</b>\n\n{announcement_text}", 
-                    parse_mode="HTML"
-                )
-            sent_count += 1
-            await asyncio.sleep(0.05)
-        except Exception as e:
-            logger.error(f"Не удалось отправить объявление пользователю {user_id}: {e}")
-            failed_count += 1
+
+def format_broadcasts_list() -> str:
+    """Текст со списком последних рассылок"""
+    jobs = sorted(load_broadcasts().values(), key=lambda job: job["created_at"], reverse=True)
+    if not jobs:
+        return "📭 Рассылок пока не было."
+    
+    lines = ["📋 <b>РАССЫЛКИ</b>\n"]
+    for job in jobs[:10]:
+        created = datetime.fromtimestamp(job["created_at"]).strftime('%d.%m %H:%M')
+        preview = (job["text"] or "🖼️ фото")[:30]
+        lines.append(
+            f"<b>{job['id']}</b> · {created} · {BROADCAST_STATUSES.get(job['status'], job['status'])}\n"
+            f"   {job['sent'] + job['failed']}/{len(job['recipients'])}, ошибок: {job['failed']} · "
+            f"<i>{html_escape(preview)}</i>"
+        )
+    return "\n".join(lines)
+
+
+@dp.message(Command("broadcasts"))
+async def cmd_broadcasts(message: Message):
+    if str(message.from_user.id) not in load_admins():
+        await message.answer("⛔ У вас нет прав администратора!")
+        return
     
-    await state.clear()
+    await message.answer(format_broadcasts_list(), parse_mode="HTML", reply_markup=create_broadcasts_keyboard())
+
+
+@dp.callback_query(F.data == "broadcasts_list")
+async def show_broadcasts_list(callback: types.CallbackQuery):
+    if str(callback.from_user.id) not in load_admins():
+        await callback.answer("⛔ У вас нет прав администратора!", show_alert=True)
+        return
+    
+    try:
+        await callback.message.edit_text(format_broadcasts_list(), parse_mode="HTML",
+                                         reply_markup=create_broadcasts_keyboard())
+    except TelegramBadRequest:
+        pass
+    await callback.answer()
+
+
+@dp.callback_query(F.data.startswith("broadcast_pause:") | F.data.startswith("broadcast_resume:")
+                   | F.data.startswith("broadcast_cancel:"))
+async def control_broadcast(callback: types.CallbackQuery):
+    if str(callback.from_user.id) not in load_admins():
+        await callback.answer("⛔ У вас нет прав администратора!", show_alert=True)
+        return
     
-    result_text = f"✅ Объявление отправлено {sent_count} пользователям!"
-    if failed_count > 0:
-        result_text += f"\n❌ Не удалось отправить {failed_count} пользователям."
+    action, job_id = callback.data.split(":", 1)
+    jobs = load_broadcasts()
+    job = jobs.get(job_id)
+    
+    if not job or job["status"] in ('done', 'cancelled'):
+        await callback.answer("Рассылка уже завершена", show_alert=True)
+    elif action == "broadcast_pause" and job["status"] == 'running':
+        job["status"] = 'paused'
+        await callback.answer(f"Рассылка {job_id} приостановлена")
+    elif action == "broadcast_resume" and job["status"] == 'paused':
+        job["status"] = 'running'
+        start_broadcast_job(job_id)
+        await callback.answer(f"Рассылка {job_id} продолжена")
+    elif action == "broadcast_cancel":
+        job["status"] = 'cancelled'
+        await callback.answer(f"Рассылка {job_id} отменена")
+    else:
+        await callback.answer()
+    
+    save_broadcasts(jobs, changed=[job_id])
     
-    await callback.message.edit_text(result_text)
+    try:
+        await callback.message.edit_text(format_broadcasts_list(), parse_mode="HTML",
+                                         reply_markup=create_broadcasts_keyboard())
+    except TelegramBadRequest:
+        pass
 
 
 @dp.callback_query(AdminStates.announcement_confirmation, F.data == "cancel_announcement")
@@ -1746,33 +3973,96 @@ async def cancel_announcement(callback: types.CallbackQuery, state: FSMContext):
     await callback.message.edit_text("❌ Отправка объявления отменена")
 
 
+NOTIFY_WORKERS = 5
+NOTIFY_MAX_LINES = 15
+
+
+def _format_slot(day: Optional[int], number: Any) -> str:
+    weekday = WEEKDAYS_SHORT[day] if isinstance(day, int) and 0 <= day < 7 else "?"
+    return f"{weekday}, {number} пара"
+
+
+def _format_change_value(value: Any) -> str:
+    if isinstance(value, list):
+        value = ", ".join(item for item in value if item.strip())
+    return html_escape(value.strip()) if value and value.strip() else "—"
+
+
+def format_schedule_changes(kind: str, name: str, changes: List[Dict]) -> str:
+    """Кратко описывает изменения расписания для уведомления"""
+    title = f"группы {name}" if kind == 'group' else f"преподавателя {name}"
+    lines = [f"🔔 <b>Изменения в расписании {html_escape(title)}</b>\n"]
+    
+    for change in changes[:NOTIFY_MAX_LINES]:
+        slot = _format_slot(change["day"], change["number"])
+        subject = html_escape(change["subject"])
+        if change["type"] == 'added':
+            lines.append(f"➕ {slot}: {subject}")
+        elif change["type"] == 'removed':
+            lines.append(f"➖ {slot}: <s>{subject}</s>")
+        elif change["type"] == 'moved':
+            lines.append(f"🔀 {subject}: {_format_slot(change['from_day'], change['from_number'])} → {slot}")
+        else:
+            emoji = {'room': '🏢', 'teacher': '👨‍🏫', 'groups': '👥'}.get(change["type"], '✏️')
+            lines.append(f"{emoji} {slot}, {subject}: "
+                         f"{_format_change_value(change.get('old'))} → {_format_change_value(change.get('new'))}")
+    
+    if len(changes) > NOTIFY_MAX_LINES:
+        lines.append(f"… и ещё {len(changes) - NOTIFY_MAX_LINES}")
+    return "\n".join(lines)
+
+
+async def notify_schedule_change(kind: str, name: str, changes: List[Dict]):
+    """Рассылает сводку изменений всем, у кого группа или преподаватель в избранном"""
+    users = load_users()
+    subscribers = [
+        user_id for user_id in get_favorite_subscribers(f"{kind}s", name)
+        if user_id in users and not users[user_id].get("inactive_since")
+    ]
+    if not subscribers:
+        return
+    
+    text = format_schedule_changes(kind, name, changes)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="📅 Открыть расписание", callback_data=entity_callback(kind, name))]
+    ])
+    pending = iter(subscribers)
+    sent = [0]
+    
+    async def worker():
+        for user_id in pending:
+            result = await deliver_message(
+                user_id, lambda: bot.send_message(user_id, text, parse_mode="HTML", reply_markup=keyboard)
+            )
+            if result == 'sent':
+                sent[0] += 1
+            elif result in INACTIVE_REASONS:
+                mark_user_inactive(user_id, result)
+    
+    await asyncio.gather(*[worker() for _ in range(min(NOTIFY_WORKERS, len(subscribers)))])
+    logger.info(f"Уведомление об изменениях {kind} {name}: {sent[0]}/{len(subscribers)} доставлено")
+
+
 async def main():
     logger.info("Бот запущен!")
     
-
-    for file, default in [
-        (USERS_FILE, []),
-        (CACHE_FILE, {"last_update": None, "teachers": {}, "groups": {}}),
-        (ADMINS_FILE, [MAIN_ADMIN_ID]),  
-        (GROUPS_FILE, {"last_update": None, "groups": []}),
-        (TEACHERS_FILE, {"last_update": None, "teachers": []}),
-        (FAVORITES_FILE, {})
-    ]:
-        if not os.path.exists(file):
-            if file == USERS_FILE:
-                save_users(default)
-            elif file == CACHE_FILE:
-                save_cache(default)
-            elif file == ADMINS_FILE:
-                save_admins(default)
-            elif file == GROUPS_FILE:
-                save_groups_cache(default)
-            elif file == TEACHERS_FILE:
-                save_teachers_cache(default)
-            elif file == FAVORITES_FILE:
-                save_favorites(default)
-    
-    await dp.start_polling(bot)
+    init_state()
+    await flush_state()
+    flush_task = asyncio.create_task(state_flush_loop())
+    get_http_session()
+    get_parser_executor()
+    prefetch_task = asyncio.create_task(prefetch_loop())
+    resume_broadcasts()
+    
+    try:
+        await dp.start_polling(bot)
+    finally:
+        flush_task.cancel()
+        prefetch_task.cancel()
+        await stop_broadcasts()
+        await close_http_session()
+        shutdown_parser_executor()
+        await flush_state()
 
 if __name__ == "__main__":
 
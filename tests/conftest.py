@@ -0,0 +1,32 @@
+import os
+import sys
+
+import aiogram.client.bot
+import pytest
+
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+aiogram.client.bot.validate_token = lambda token: True
+
+
+@pytest.fixture
+def state(tmp_path, monkeypatch):
+    """Чистое хранилище бота во временном каталоге и парсинг в потоках"""
+    import bot
+    
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(bot, '_state', {})
+    monkeypatch.setattr(bot, '_dirty', {})
+    monkeypatch.setattr(bot, '_storage', None)
+    monkeypatch.setattr(bot, '_list_indexes', {})
+    monkeypatch.setattr(bot, '_search_indexes', {})
+    monkeypatch.setattr(bot, '_render_cache', bot.OrderedDict())
+    monkeypatch.setattr(bot, '_render_cache_chars', 0)
+    monkeypatch.setattr(bot, '_favorites_by_user', None)
+    monkeypatch.setattr(bot, '_favorites_by_entity', {})
+    monkeypatch.setattr(bot, '_access_stats', {})
+    monkeypatch.setattr(bot, 'PARSER_EXECUTOR', 'thread')
+    monkeypatch.setattr(bot, '_parser_executor', None)
+    yield bot
+    bot.shutdown_parser_executor()
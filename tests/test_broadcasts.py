@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+ADMIN_ID = 1
+
+
+class FakeCallback:
+    def __init__(self, data: str):
+        self.data = data
+        self.from_user = SimpleNamespace(id=ADMIN_ID)
+        self.message = SimpleNamespace(edit_text=self.edit_text)
+    
+    async def answer(self, *args, **kwargs):
+        pass
+    
+    async def edit_text(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def broadcast(state, monkeypatch):
+    state.save_users({str(user_id): {"first_seen": None, "last_seen": None} for user_id in range(100, 200)})
+    state.save_admins([str(ADMIN_ID)])
+    monkeypatch.setattr(state, '_broadcast_tasks', {})
+    monkeypatch.setattr(state, '_broadcasts_stopping', False)
+    
+    delivered = []
+    
+    async def deliver_announcement(user_id, text, photo_id):
+        delivered.append(user_id)
+        await asyncio.sleep(0)
+        return 'sent'
+    
+    monkeypatch.setattr(state, 'deliver_announcement', deliver_announcement)
+    return delivered
+
+
+async def wait_for_broadcasts(bot):
+    while bot._broadcast_tasks:
+        await asyncio.gather(*bot._broadcast_tasks.values())
+
+
+def test_resume_during_final_progress_update_finishes_job(state, broadcast, monkeypatch):
+    async def scenario():
+        job = state.create_broadcast_job("Объявление", None, str(ADMIN_ID), 1, 1)
+        resumed = []
+        
+        async def update_broadcast_progress(chat_id, message_id, text):
+            if job["status"] == 'paused' and not resumed:
+                resumed.append(True)
+                await state.control_broadcast(FakeCallback(f"broadcast_resume:{job['id']}"))
+        
+        monkeypatch.setattr(state, 'update_broadcast_progress', update_broadcast_progress)
+        
+        original = state.deliver_announcement
+        
+        async def deliver_and_pause(user_id, text, photo_id):
+            result = await original(user_id, text, photo_id)
+            if len(broadcast) == 50:
+                await state.control_broadcast(FakeCallback(f"broadcast_pause:{job['id']}"))
+            return result
+        
+        monkeypatch.setattr(state, 'deliver_announcement', deliver_and_pause)
+        
+        state.start_broadcast_job(job["id"])
+        await wait_for_broadcasts(state)
+        return job, resumed
+    
+    job, resumed = asyncio.run(scenario())
+    
+    assert resumed
+    assert job["status"] == 'done'
+    assert job["cursor"] == len(job["recipients"]) == 100
+    assert sorted(broadcast) == sorted(job["recipients"])
+
+
+def test_starting_running_job_twice_does_not_duplicate(state, broadcast, monkeypatch):
+    async def update_broadcast_progress(chat_id, message_id, text):
+        pass
+    
+    monkeypatch.setattr(state, 'update_broadcast_progress', update_broadcast_progress)
+    
+    async def scenario():
+        job = state.create_broadcast_job("Объявление", None, str(ADMIN_ID), 1, 1)
+        state.start_broadcast_job(job["id"])
+        state.start_broadcast_job(job["id"])
+        assert len(state._broadcast_tasks) == 1
+        await wait_for_broadcasts(state)
+        return job
+    
+    job = asyncio.run(scenario())
+    
+    assert job["status"] == 'done'
+    assert job["sent"] == 100
+    assert len(broadcast) == 100
@@ -0,0 +1,118 @@
+import asyncio
+import os
+
+import pytest
+
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+
+def read_page(name: str) -> bytes:
+    with open(os.path.join(PAGES_DIR, f"{name}.html"), encoding='utf-8') as f:
+        return f.read().encode('windows-1251')
+
+
+class FakeResponse:
+    def __init__(self, status: int, body: bytes = b'', etag: str = None):
+        self.status = status
+        self.body = body
+        self.headers = {'ETag': etag} if etag else {}
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+    
+    async def read(self) -> bytes:
+        return self.body
+    
+    async def text(self) -> str:
+        return self.body.decode('utf-8')
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+    
+    def get(self, url, timeout=None, headers=None):
+        self.requests.append(dict(headers or {}))
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def site(state, monkeypatch):
+    def serve(*responses):
+        session = FakeSession(responses)
+        monkeypatch.setattr(state, 'get_http_session', lambda: session)
+        return session
+    return serve
+
+
+def load(bot):
+    return asyncio.run(bot.load_group_schedule('ИС-21', 'cg41.htm'))
+
+
+def test_validators_saved_after_successful_store(state, site):
+    site(FakeResponse(200, read_page('group'), etag='"v1"'))
+    
+    schedule = load(state)
+    
+    assert schedule['days']
+    assert state.load_validators()[f"{state.BASE_URL}/cg41.htm"]['etag'] == '"v1"'
+    assert state.get_cache_entry(state.load_cache()['groups'], 'group_ИС-21')['data'] == schedule
+
+
+def test_unparsable_page_keeps_previous_validators(state, site):
+    url = f"{state.BASE_URL}/cg41.htm"
+    site(FakeResponse(200, read_page('group'), etag='"v1"'))
+    good = load(state)
+    
+    broken = site(
+        FakeResponse(200, '<html><body>Сайт на обслуживании</body></html>'.encode('windows-1251'), etag='"v2"'),
+        FakeResponse(200, '<html><body>Сайт на обслуживании</body></html>'.encode('windows-1251'), etag='"v2"'),
+    )
+    
+    assert 'error' in load(state)
+    assert state.load_validators()[url]['etag'] == '"v1"'
+    
+    assert 'error' in load(state)
+    assert broken.requests[1]['If-None-Match'] == '"v1"'
+    assert state.get_cache_entry(state.load_cache()['groups'], 'group_ИС-21')['data'] == good
+
+
+def test_unchanged_body_reuses_cached_schedule(state, site):
+    site(FakeResponse(200, read_page('group')))
+    first = load(state)
+    
+    site(FakeResponse(200, read_page('group')))
+    
+    assert load(state) == first
+    assert state.get_cache_entry(state.load_cache()['groups'], 'group_ИС-21')['version'] == 1
+
+
+MAINTENANCE_PAGE = '<html><body>Сайт на обслуживании</body></html>'.encode('windows-1251')
+
+
+def test_empty_list_page_keeps_previous_validators(state, site):
+    url = f"{state.BASE_URL}/cg.htm"
+    site(FakeResponse(200, read_page('groups_list'), etag='"v1"'))
+    asyncio.run(state.fetch_groups_list())
+    
+    site(FakeResponse(200, MAINTENANCE_PAGE, etag='"v2"'))
+    asyncio.run(state.fetch_groups_list())
+    
+    assert state.load_validators()[url]['etag'] == '"v1"'
+
+
+def test_empty_list_page_keeps_cached_list(state, site):
+    site(FakeResponse(200, read_page('groups_list')))
+    groups = asyncio.run(state.fetch_groups_list())
+    
+    site(FakeResponse(200, MAINTENANCE_PAGE))
+    
+    assert asyncio.run(state.fetch_groups_list()) == groups
+    assert state.load_groups_cache()['groups'] == groups
+    assert state.find_group('ИС-21') is not None
+    assert state.get_search_index('groups').search('ис')
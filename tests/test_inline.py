@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+
+class FakeInlineQuery:
+    def __init__(self, query_id: str, query: str, user_id: int = 1):
+        self.id = query_id
+        self.query = query
+        self.from_user = SimpleNamespace(id=user_id)
+        self.answers = []
+    
+    async def answer(self, results, **kwargs):
+        self.answers.append((results, kwargs))
+
+
+@pytest.fixture
+def site(state, monkeypatch):
+    state.save_groups_cache({"last_update": None, "groups": [
+        {"name": "ИС-21", "url": "cg41.htm", "filename": "cg41.htm"},
+        {"name": "ИС-22", "url": "cg42.htm", "filename": "cg42.htm"},
+        {"name": "ИС-23", "url": "cg43.htm", "filename": "cg43.htm"},
+    ]})
+    monkeypatch.setattr(state, 'INLINE_DEBOUNCE', 0.05)
+    
+    loads = []
+    
+    async def load_group_schedule(name, filename):
+        loads.append(name)
+        state.store_cache_entry(state.load_cache()['groups'], f"group_{name}",
+                                {'title': name, 'group': name, 'days': [], 'last_update': None}, filename)
+    
+    monkeypatch.setattr(state, 'load_group_schedule', load_group_schedule)
+    return loads
+
+
+def test_typing_loads_only_last_top_match(state, site):
+    queries = [FakeInlineQuery(str(i), text) for i, text in enumerate(['ИС', 'ИС-2', 'ИС-21'])]
+    
+    async def type_query():
+        tasks = []
+        for query in queries:
+            tasks.append(asyncio.create_task(state.inline_schedule_lookup(query)))
+            await asyncio.sleep(0.01)
+        await asyncio.gather(*tasks)
+    
+    asyncio.run(type_query())
+    
+    assert site == ['ИС-21']
+    assert all(query.answers for query in queries)
+    assert [result.title for result in queries[-1].answers[0][0]] == ['👥 ИС-21']
+
+
+def test_cached_results_do_not_fetch(state, site):
+    for name in ('ИС-21', 'ИС-22', 'ИС-23'):
+        state.store_cache_entry(state.load_cache()['groups'], f"group_{name}",
+                                {'title': name, 'group': name, 'days': [], 'last_update': None}, 'x.htm')
+    query = FakeInlineQuery('1', 'ИС')
+    
+    asyncio.run(state.inline_schedule_lookup(query))
+    
+    assert site == []
+    assert len(query.answers[0][0]) == 3
+
+
+def long_schedule(name: str) -> dict:
+    days = []
+    for day in range(6):
+        days.append({'weekday': f"День {day + 1}", 'weekday_idx': day, 'lessons': [
+            {'number': number, 'subject': f"Междисциплинарный курс {number} " + "очень длинное название " * 4,
+             'groups': ['ИС-21', 'ИС-22'], 'room': '201', 'time_start': '8:30', 'time_end': '10:00'}
+            for number in range(1, 7)
+        ]})
+    return {'title': name, 'teacher': name, 'days': days, 'last_update': None}
+
+
+@pytest.fixture
+def long_teacher(state, monkeypatch):
+    state.save_teachers_cache({"last_update": None, "teachers": [
+        {"name": "Петров В.В.", "url": "cp101.htm", "filename": "cp101.htm"}
+    ]})
+    state.store_cache_entry(state.load_cache()['teachers'], 'teacher_Петров В.В.', long_schedule('Петров В.В.'), 'cp101.htm')
+    
+    async def me():
+        return SimpleNamespace(username='college_timetable_bot')
+    
+    monkeypatch.setattr(state.bot, 'me', me)
+    return state.render_schedule_pages('teacher', 'Петров В.В.')
+
+
+def test_multipage_result_links_to_full_schedule(state, long_teacher):
+    assert len(long_teacher) > 1
+    query = FakeInlineQuery('1', 'Петров')
+    
+    asyncio.run(state.inline_schedule_lookup(query))
+    
+    result = query.answers[0][0][0]
+    text = result.input_message_content.message_text
+    assert text.startswith(long_teacher[0])
+    assert 'продолжение' in text and len(text) <= 4096
+    url = result.reply_markup.inline_keyboard[0][0].url
+    assert url.startswith('https://t.me/college_timetable_bot?start=teacher_')
+    assert state.parse_schedule_deep_link(url.split('start=')[1]) == ('teacher', 'Петров В.В.')
+
+
+def test_deep_link_start_sends_schedule(state, long_teacher):
+    sent = []
+    
+    async def answer(text, **kwargs):
+        sent.append((text, kwargs))
+    
+    message = SimpleNamespace(from_user=SimpleNamespace(id=5), answer=answer)
+    payload = state.schedule_deep_link_payload('teacher', 'Петров В.В.')
+    
+    asyncio.run(state.cmd_start(message, SimpleNamespace(args=payload)))
+    
+    assert sent[0][0] == long_teacher[0]
+    assert state.parse_schedule_deep_link('teacher_999') is None
+    assert state.parse_schedule_deep_link('foo') is None
@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import bot
+
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+
+PAGES = [
+    ('group', 'parse_group_schedule', ('ИС-21',)),
+    ('teacher', 'parse_teacher_schedule', ('Петров В.В.',)),
+    ('groups_list', 'parse_groups_list', ()),
+    ('teachers_list', 'parse_teachers_list', ()),
+]
+
+
+CASES = [
+    pytest.param(f"{page}{suffix}", method, args, id=f"{page}{suffix}")
+    for page, method, args in PAGES
+    for suffix in ('', '_unclosed')
+]
+
+
+def read_page(name: str) -> str:
+    with open(os.path.join(PAGES_DIR, f"{name}.html"), encoding='utf-8') as f:
+        return f.read()
+
+
+def parse(backend: str, page: str, method: str, args: tuple):
+    return getattr(bot.PARSER_BACKENDS[backend], method)(read_page(page), *args)
+
+
+@pytest.mark.parametrize('page, method, args', CASES)
+def test_lxml_matches_bs4(page, method, args):
+    """Быстрый движок выдаёт ровно то же, что эталонный"""
+    expected = parse('bs4', page, method, args)
+    
+    assert expected
+    assert parse('lxml', page, method, args) == expected
+
+
+@pytest.mark.parametrize('backend', ['bs4', 'lxml'])
+@pytest.mark.parametrize('page, method, args', [pytest.param(*case, id=case[0]) for case in PAGES])
+def test_unclosed_cells_parse_like_closed(backend, page, method, args):
+    """Незакрытые <td>/<tr> не склеивают соседние пары и строки"""
+    assert parse(backend, f"{page}_unclosed", method, args) == parse(backend, page, method, args)
+
+
+def test_group_schedule_content():
+    schedule = parse('lxml', 'group', 'parse_group_schedule', ('ИС-21',))
+    
+    assert [day['weekday'] for day in schedule['days']] == ['Понедельник', 'Вторник', 'Четверг', 'Пятница']
+    assert schedule['days'][0]['lessons'][1] == {
+        'number': 2,
+        'subject': 'Математика',
+        'teacher': 'Петров В.В.',
+        'room': '201',
+        'time_start': '9:10',
+        'time_end': '10:30'
+    }
+    assert schedule['days'][1]['lessons'][2]['subject'] == 'Классный час'
+    assert schedule['last_update'] == 'Обновлено: 01.02.2025 в 14:35'
+
+
+def test_teacher_schedule_content():
+    schedule = parse('lxml', 'teacher', 'parse_teacher_schedule', ('Петров В.В.',))
+    lessons = [lesson for day in schedule['days'] for lesson in day['lessons']]
+    
+    assert [lesson['groups'] for lesson in lessons] == [['ИС-21'], ['ИС-22', 'ИС-23'], ['ПК-31'], ['ПК-31'], ['ЗИО-11']]
+    assert lessons[2]['subject'] == 'Консультация'
+    assert lessons[3]['room'] == 'Ауд.12'
+
+
+def test_teachers_list_skips_vacancies():
+    teachers = parse('lxml', 'teachers_list', 'parse_teachers_list', ())
+    
+    assert [teacher['name'] for teacher in teachers] == ['Петров В.В.', 'Иванова А.П.']
+    assert teachers[1]['filename'] == 'cp103.htm'
+
+
+def test_parse_page_falls_back_to_bs4(monkeypatch):
+    def broken(*args):
+        raise ValueError("broken page")
+    
+    monkeypatch.setattr(bot.PARSER_BACKENDS['lxml'], 'parse_groups_list', broken)
+    
+    assert bot.parse_page('lxml', 'parse_groups_list', read_page('groups_list')) == parse(
+        'bs4', 'groups_list', 'parse_groups_list', ()
+    )
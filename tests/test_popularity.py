@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+
+def test_repeated_views_count_one_user(state):
+    for _ in range(10):
+        state.record_schedule_access('group', 'ИС-21', '1')
+    
+    assert state.get_popularity('group', 'ИС-21') == 1
+    
+    state.record_schedule_access('group', 'ИС-21', '2')
+    state.add_favorite('3', 'groups', 'ИС-21')
+    state.add_favorite('1', 'groups', 'ИС-21')
+    
+    assert state.get_popularity('group', 'ИС-21') == 3
+
+
+def test_old_views_expire(state):
+    now = time.time()
+    state.record_schedule_access('teacher', 'Петров В.В.', '1', now - state.ACCESS_WINDOW - 1)
+    state.record_schedule_access('teacher', 'Петров В.В.', '2', now)
+    
+    assert state.get_popularity('teacher', 'Петров В.В.', now) == 1
+    
+    state.prune_access_stats(now)
+    
+    assert list(state._access_stats[('teacher', 'Петров В.В.')]) == ['2']
+
+
+def test_hot_set_is_capped_and_needs_several_users(state, monkeypatch):
+    monkeypatch.setattr(state, 'PREFETCH_HOT_LIMIT', 2)
+    ranked = [(5, 'group', 'A'), (4, 'group', 'B'), (3, 'group', 'C'), (1, 'group', 'D')]
+    
+    assert state.select_hot_entities(ranked, rush=False) == {('group', 'A'), ('group', 'B')}
+    assert state.select_hot_entities(ranked[2:], rush=False) == {('group', 'C')}
+    assert state.select_hot_entities(ranked[3:], rush=False) == set()
+    assert state.select_hot_entities(ranked[3:], rush=True) == {('group', 'D')}
+
+
+@pytest.fixture
+def prefetch(state, monkeypatch):
+    groups = [{"name": name, "url": f"{name}.htm", "filename": f"{name}.htm"} for name in ('A', 'B', 'C')]
+    state.save_groups_cache({"last_update": None, "groups": groups})
+    state.save_teachers_cache({"last_update": None, "teachers": [{"name": "T", "url": "t.htm", "filename": "t.htm"}]})
+    monkeypatch.setattr(state, '_lists_refreshed_at', time.time())
+    monkeypatch.setattr(state, 'PREFETCH_REQUEST_DELAY', 0)
+    monkeypatch.setattr(state, 'is_rush_hour', lambda now: False)
+    
+    ten_minutes_ago = time.time() - 10 * 60
+    cache = state.load_cache()
+    for kind, name in (('group', 'A'), ('group', 'B'), ('group', 'C'), ('teacher', 'T')):
+        state.store_cache_entry(cache[f"{kind}s"], f"{kind}_{name}", {'days': []}, f"{name}.htm")
+        cache[f"{kind}s"][f"{kind}_{name}"]["fetched_at"] = ten_minutes_ago
+    
+    loads = []
+    
+    async def loader(name, filename):
+        loads.append(name)
+    
+    monkeypatch.setattr(state, 'load_group_schedule', loader)
+    monkeypatch.setattr(state, 'load_teacher_schedule', loader)
+    return loads
+
+
+def test_prefetch_refreshes_only_hot_entries_early(state, prefetch):
+    for user_id in ('1', '2', '3'):
+        state.record_schedule_access('group', 'B', user_id)
+    state.record_schedule_access('group', 'C', '1')
+    state.add_favorite('2', 'groups', 'C')
+    
+    asyncio.run(state.prefetch_all_schedules())
+    
+    assert prefetch == ['B']
@@ -0,0 +1,42 @@
+import copy
+import os
+
+import pytest
+
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pages')
+
+
+@pytest.fixture
+def schedule(state):
+    with open(os.path.join(PAGES_DIR, 'group.html'), encoding='utf-8') as f:
+        return state.parse_group_schedule_html(f.read(), 'ИС-21')
+
+
+def test_changed_data_renders_new_version(state, schedule):
+    bot = state
+    section = bot.load_cache()['groups']
+    bot.store_cache_entry(section, 'group_ИС-21', schedule, 'cg41.htm')
+    assert 'Математика' in bot.render_schedule_pages('group', 'ИС-21')[0]
+    
+    changed = copy.deepcopy(schedule)
+    changed['days'][0]['lessons'][1]['subject'] = 'Геометрия'
+    bot.store_cache_entry(section, 'group_ИС-21', changed, 'cg41.htm')
+    
+    assert 'Геометрия' in bot.render_schedule_pages('group', 'ИС-21')[0]
+
+
+def test_recreated_entry_does_not_reuse_old_render(state, schedule):
+    bot = state
+    section = bot.load_cache()['groups']
+    bot.store_cache_entry(section, 'group_ИС-21', schedule, 'cg41.htm')
+    assert 'Математика' in bot.render_schedule_pages('group', 'ИС-21')[0]
+    
+    del section['group_ИС-21']
+    changed = copy.deepcopy(schedule)
+    changed['days'][0]['lessons'][1]['subject'] = 'Геометрия'
+    bot.store_cache_entry(section, 'group_ИС-21', changed, 'cg41.htm')
+    
+    assert section['group_ИС-21']['version'] == 1
+    assert 'Геометрия' in bot.render_schedule_pages('group', 'ИС-21')[0]
+    assert bot._render_cache_chars == sum(len(page) for _, pages in bot._render_cache.values() for page in pages)
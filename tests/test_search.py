@@ -0,0 +1,34 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+from aiogram.types import Chat, Message, User
+
+import bot
+
+
+def make_message(chat_type: str, text: str) -> Message:
+    return Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=1, type=chat_type),
+        from_user=User(id=1, is_bot=False, first_name="Тест"),
+        text=text,
+    )
+
+
+def free_text_search_matches(message: Message) -> bool:
+    handler = next(handler for handler in bot.dp.message.handlers
+                   if handler.callback is bot.process_free_text_search)
+    matched, _ = asyncio.run(handler.check(message, raw_state=None))
+    return matched
+
+
+@pytest.mark.parametrize('chat_type, text, expected', [
+    ('private', 'ис-21', True),
+    ('private', '/start', False),
+    ('group', 'ис-21', False),
+    ('supergroup', 'ис-21', False),
+])
+def test_free_text_search_only_in_private_chats(chat_type, text, expected):
+    assert free_text_search_matches(make_message(chat_type, text)) is expected
@@ -0,0 +1,51 @@
+import re
+
+import pytest
+
+import bot
+
+
+def assert_balanced(page: str):
+    open_tags = []
+    for closing, tag in re.findall(r'<(/?)([a-zA-Z]+)[^>]*>', page):
+        if closing:
+            assert open_tags and open_tags.pop() == tag
+        else:
+            open_tags.append(tag)
+    assert not open_tags
+
+
+def test_splits_at_day_boundaries():
+    days = [f"📌 <b>День {i}</b>\n" + "\n".join(f"{n}. <i>Пара {n}</i>" for n in range(20)) for i in range(6)]
+    text = "\n".join(days)
+    
+    pages = bot.split_message(text, limit=600)
+    
+    assert len(pages) > 1
+    assert all(len(page) <= 600 for page in pages)
+    assert all(page.startswith("📌 ") for page in pages)
+    for page in pages:
+        assert_balanced(page)
+
+
+def test_long_line_keeps_tags_balanced():
+    text = "<b>" + "слово " * 500 + "</b>"
+    
+    pages = bot.split_message(text, limit=300)
+    
+    assert all(len(page) <= 300 for page in pages)
+    for page in pages:
+        assert_balanced(page)
+    assert re.sub(r'</?b>', '', "".join(pages)) == "слово " * 500
+
+
+@pytest.mark.parametrize('text', [
+    "&" + "x" * 1000,
+    "<" + "x" * 1000,
+    "&amp;" + "&" + "y" * 1000,
+])
+def test_unterminated_markup_without_newlines_makes_progress(text):
+    pages = bot.split_message(text, limit=200)
+    
+    assert "".join(pages) == text
+    assert all(len(page) <= 200 for page in pages)